@@ -0,0 +1,176 @@
+"""Admission control and priority scheduling for podcast generation.
+
+A generation holds one of ADMISSION_SLOTS slots for as long as it runs;
+the rest wait in a bounded queue on the async core. The queue is ordered
+by arrival time plus estimated run time, so cheap jobs overtake expensive
+ones that arrived shortly before them, and nothing waits forever. Run
+time is a job's cost (in "medium podcast" units) times a moving average
+of measured seconds per unit.
+
+Requests that are allowed to shed (interactive ones, which hold a web
+thread while they wait) are turned away straight away with Busy when the
+queue is full or their estimated wait exceeds ADMISSION_MAX_WAIT. They get
+a fast "retry in N s" rather than all of them timing out later. Background
+work (jobs, batches) just waits its turn.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+
+SLOTS = int(os.environ.get('ADMISSION_SLOTS', '16'))  # generations running at once
+MAX_QUEUE = int(os.environ.get('ADMISSION_QUEUE', '64'))  # generations waiting
+MAX_WAIT = float(os.environ.get('ADMISSION_MAX_WAIT', '60'))  # seconds
+UNIT_SECONDS = float(os.environ.get('ADMISSION_UNIT_SECONDS', '20'))  # first guess
+SMOOTHING = 0.2  # weight of the newest sample in the seconds-per-unit average
+
+
+class Busy(Exception):
+    """Too much work queued; try again in `retry_after` seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__(f'Busy, retry in {retry_after}s')
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Slots plus a priority queue of waiting generations.
+
+    Thread-safe; waiters are futures on the loop that called admit(), and
+    release() may come from any thread.
+    """
+
+    def __init__(self, slots=SLOTS, max_queue=MAX_QUEUE, max_wait=MAX_WAIT,
+                 unit_seconds=UNIT_SECONDS):
+        self.slots = slots
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.unit_seconds = unit_seconds
+        self.running = 0
+        self.running_cost = 0.0
+        self.counts = {'admitted': 0, 'queued': 0, 'shed': 0}
+        self._queue = []  # heap of [key, seq, cost, future]
+        self._queued_cost = 0.0
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def estimated_wait(self, key=None):
+        """Seconds until a slot frees up for a job queued at priority `key`."""
+        with self._lock:
+            return self._estimated_wait(key)
+
+    def _estimated_wait(self, key=None):
+        if self.running < self.slots and not self._queue:
+            return 0.0
+        if key is None:
+            ahead = self._queued_cost
+        else:
+            ahead = sum(entry[2] for entry in self._queue if entry[0] <= key)
+        # Running jobs are about half done on average
+        return (ahead + self.running_cost / 2) * self.unit_seconds / self.slots
+
+    def retry_after(self):
+        """Whole seconds a turned-away client should wait before retrying."""
+        with self._lock:
+            return max(1, math.ceil(self._estimated_wait()))
+
+    async def admit(self, cost, shed=True):
+        """Wait for a slot; returns a ticket for release().
+
+        With `shed`, raises Busy instead of queueing behind more than
+        max_wait seconds of work or a full queue.
+        """
+        with self._lock:
+            if self.running < self.slots and not self._queue:
+                self._start(cost)
+                return (cost, time.monotonic())
+            key = time.monotonic() + cost * self.unit_seconds
+            if shed and (len(self._queue) >= self.max_queue
+                         or self._estimated_wait(key) > self.max_wait):
+                self.counts['shed'] += 1
+                raise Busy(max(1, math.ceil(self._estimated_wait())))
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._queue, [key, next(self._seq), cost, future])
+            self._queued_cost += cost
+            self.counts['queued'] += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                if not future.cancelled() and future.done():
+                    # Handed a slot in the same moment the caller went away
+                    self._finish(cost)
+                    self._wake()
+                else:
+                    self._drop(future)
+            raise
+        return (cost, time.monotonic())
+
+    def release(self, ticket, completed=True):
+        """Free a slot; a `completed` job's run time feeds the estimate."""
+        cost, started = ticket
+        elapsed = time.monotonic() - started
+        with self._lock:
+            # Failed or abandoned jobs stop early and would skew it down
+            if completed and cost > 0:
+                self.unit_seconds += SMOOTHING * (elapsed / cost - self.unit_seconds)
+            self._finish(cost)
+            self._wake()
+
+    @asynccontextmanager
+    async def slot(self, cost, shed=True):
+        ticket = await self.admit(cost, shed)
+        completed = False
+        try:
+            yield
+            completed = True
+        finally:
+            self.release(ticket, completed)
+
+    def _start(self, cost):
+        self.running += 1
+        self.running_cost += cost
+        self.counts['admitted'] += 1
+
+    def _finish(self, cost):
+        self.running -= 1
+        self.running_cost = max(0.0, self.running_cost - cost)
+
+    def _drop(self, future):
+        for index, entry in enumerate(self._queue):
+            if entry[3] is future:
+                self._queued_cost -= entry[2]
+                self._queue[index] = self._queue[-1]
+                self._queue.pop()
+                heapq.heapify(self._queue)
+                return
+
+    def _wake(self):
+        # Hand free slots to the best waiters; the slot is taken here, so
+        # nobody arriving in between can jump the queue
+        while self.running < self.slots and self._queue:
+            _, _, cost, future = heapq.heappop(self._queue)
+            self._queued_cost -= cost
+            self._start(cost)
+            future.get_loop().call_soon_threadsafe(self._hand_over, future, cost)
+
+    def _hand_over(self, future, cost):
+        if future.done():
+            # The waiter was cancelled before the hand-over ran
+            with self._lock:
+                self._finish(cost)
+                self._wake()
+        else:
+            future.set_result(None)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counts, running=self.running, waiting=len(self._queue),
+                         queued_cost=round(self._queued_cost, 2),
+                         unit_seconds=round(self.unit_seconds, 2),
+                         estimated_wait=round(self._estimated_wait(), 1))
+        return stats
@@ -0,0 +1,75 @@
+"""Process-wide asyncio core for the I/O-bound pipeline stages.
+
+One event loop runs on a daemon thread per process. Pipelines run on it as
+coroutines, so a generation that is waiting on Gemini or TTS costs a task
+rather than a thread. The blocking clients (requests, gTTS, the Gemini SDK)
+are awaited through offload(), which runs them on one shared executor.
+Synchronous code (Flask views, job workers) hands coroutines over with run()
+or submit(); never call run() from the loop itself. Callbacks made from
+inside a pipeline (progress reports) run on the loop and must be quick.
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+IO_THREADS = int(os.environ.get('IO_THREADS', '128'))
+
+
+class AsyncCore:
+    """An event loop thread plus the executor its blocking calls run on."""
+
+    def __init__(self, io_threads=IO_THREADS):
+        self.io_threads = io_threads
+        self.in_flight = 0  # coroutines handed over and not finished yet
+        self._loop = None
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._lock:
+            # Started lazily, and again in a forked child (e.g. a gunicorn
+            # worker under --preload), where the parent's loop thread is gone
+            if self._loop is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(self.io_threads, thread_name_prefix='io')
+                self._loop = asyncio.new_event_loop()
+                self._loop.set_default_executor(self._executor)
+                threading.Thread(target=self._loop.run_forever, name='async-core',
+                                 daemon=True).start()
+                self._pid = os.getpid()
+            return self._loop
+
+    async def _run(self, context, coro):
+        # Tasks start from the loop thread's context; carry the caller's
+        # (trace ID and friends) over
+        for var, value in context.items():
+            var.set(value)
+        self.in_flight += 1
+        try:
+            return await coro
+        finally:
+            self.in_flight -= 1
+
+    def submit(self, coro):
+        """Schedule `coro` on the loop and return a concurrent.futures.Future."""
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(
+            self._run(contextvars.copy_context(), coro), loop)
+
+    def run(self, coro):
+        """Run `coro` on the loop, blocking the calling thread for its result."""
+        return self.submit(coro).result()
+
+    async def offload(self, fn, *args, **kwargs):
+        """Await a blocking call on the shared I/O executor."""
+        call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+
+    def stats(self):
+        return {'in_flight': self.in_flight, 'io_threads': self.io_threads}
+
+
+core = AsyncCore()
@@ -1,422 +1,212 @@
+import asyncio
+import contextvars
+import importlib
+import json
+import logging
+import math
+import mimetypes
 import os
-
-from flask import Flask, render_template_string, request, send_file
-import google.generativeai as genai  # type: ignore
-from gtts import gTTS
-import requests
-from bs4 import BeautifulSoup
-
-app = Flask(__name__)
-
-genai.configure(api_key=os.environ.get('GEMINI_API_KEY'))
-model = genai.GenerativeModel('gemini-2.0-flash')
-
-HTML_TEMPLATE = '''
-<!DOCTYPE html>
-<html>
-<head>
-    <title>Huxe Audio - Text to Podcast</title>
-    <style>
-        * { box-sizing: border-box; }
-        body {
-            font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, sans-serif;
-            max-width: 1200px;
-            margin: 0 auto;
-            padding: 40px 20px;
-            background: #0f0f0f;
-            color: #ffffff;
-        }
-        h1 {
-            text-align: center;
-            font-size: 2rem;
-            margin-bottom: 0.5rem;
-        }
-        .subtitle {
-            text-align: center;
-            color: #888;
-            margin-bottom: 2rem;
-        }
-        .main-container {
-            display: grid;
-            grid-template-columns: 1fr 1fr;
-            gap: 32px;
-        }
-        @media (max-width: 768px) {
-            .main-container {
-                grid-template-columns: 1fr;
-            }
-        }
-        .input-section, .result-section {
-            min-height: 400px;
-        }
-        .section-title {
-            font-size: 14px;
-            text-transform: uppercase;
-            letter-spacing: 1px;
-            color: #666;
-            margin-bottom: 16px;
-        }
-        .tabs {
-            display: flex;
-            gap: 0;
-            margin-bottom: 0;
-        }
-        .tab {
-            flex: 1;
-            padding: 12px 24px;
-            background: #1a1a1a;
-            border: 1px solid #333;
-            border-bottom: none;
-            color: #888;
-            cursor: pointer;
-            font-size: 16px;
-            transition: all 0.2s;
-            text-align: center;
-        }
-        .tab:first-child {
-            border-radius: 8px 0 0 0;
-        }
-        .tab:last-child {
-            border-radius: 0 8px 0 0;
-        }
-        .tab.active {
-            background: #252525;
-            color: #fff;
-            border-color: #444;
-        }
-        .tab:hover:not(.active) {
-            background: #222;
-        }
-        .tab-content {
-            display: none;
-            background: #252525;
-            border: 1px solid #444;
-            border-top: none;
-            border-radius: 0 0 8px 8px;
-            padding: 20px;
-        }
-        .tab-content.active {
-            display: block;
-        }
-        textarea {
-            width: 100%;
-            height: 180px;
-            padding: 16px;
-            border: 1px solid #333;
-            border-radius: 8px;
-            font-size: 16px;
-            background: #1a1a1a;
-            color: #fff;
-            resize: vertical;
-        }
-        textarea:focus, input[type="url"]:focus {
-            outline: none;
-            border-color: #0066ff;
-        }
-        input[type="url"] {
-            width: 100%;
-            padding: 16px;
-            border: 1px solid #333;
-            border-radius: 8px;
-            font-size: 16px;
-            background: #1a1a1a;
-            color: #fff;
-        }
-        .url-hint {
-            color: #666;
-            font-size: 14px;
-            margin-top: 8px;
-        }
-        .length-section {
-            margin-top: 16px;
-        }
-        .length-label {
-            font-size: 14px;
-            color: #888;
-            margin-bottom: 8px;
-            display: block;
-        }
-        select {
-            width: 100%;
-            padding: 12px 16px;
-            border: 1px solid #333;
-            border-radius: 8px;
-            font-size: 16px;
-            background: #1a1a1a;
-            color: #fff;
-            cursor: pointer;
-            appearance: none;
-            background-image: url("data:image/svg+xml,%3Csvg xmlns='http://www.w3.org/2000/svg' width='12' height='12' fill='%23888' viewBox='0 0 16 16'%3E%3Cpath d='M8 11L3 6h10l-5 5z'/%3E%3C/svg%3E");
-            background-repeat: no-repeat;
-            background-position: right 16px center;
-        }
-        select:focus {
-            outline: none;
-            border-color: #0066ff;
-        }
-        button {
-            width: 100%;
-            padding: 16px 32px;
-            font-size: 18px;
-            background: #0066ff;
-            color: white;
-            border: none;
-            border-radius: 8px;
-            cursor: pointer;
-            margin-top: 16px;
-        }
-        button:hover { background: #0052cc; }
-        button:disabled {
-            background: #333;
-            cursor: not-allowed;
-        }
-        .result-section {
-            background: #1a1a1a;
-            border-radius: 12px;
-            padding: 24px;
-        }
-        .result-placeholder {
-            display: flex;
-            flex-direction: column;
-            align-items: center;
-            justify-content: center;
-            height: 300px;
-            color: #444;
-            text-align: center;
-        }
-        .result-placeholder-icon {
-            font-size: 48px;
-            margin-bottom: 16px;
-        }
-        .audio-section {
-            margin-bottom: 24px;
-        }
-        audio {
-            width: 100%;
-            margin: 12px 0;
-        }
-        .download-btn {
-            background: #22c55e;
-            text-decoration: none;
-            display: inline-block;
-            text-align: center;
-            padding: 12px 24px;
-            font-size: 16px;
-            border-radius: 8px;
-            color: white;
-            border: none;
-            cursor: pointer;
-            width: 100%;
-        }
-        .download-btn:hover { background: #16a34a; }
-        .script-section {
-            margin-top: 24px;
-        }
-        .script-container {
-            background: #0f0f0f;
-            border-radius: 8px;
-            padding: 16px;
-            max-height: 300px;
-            overflow-y: auto;
-        }
-        .script-line {
-            padding: 8px 12px;
-            margin-bottom: 8px;
-            border-radius: 6px;
-            font-size: 14px;
-            line-height: 1.5;
-        }
-        .script-line.alex {
-            background: rgba(59, 130, 246, 0.15);
-            border-left: 3px solid #3b82f6;
-        }
-        .script-line.sam {
-            background: rgba(168, 85, 247, 0.15);
-            border-left: 3px solid #a855f7;
-        }
-        .script-line .host-name {
-            font-weight: 600;
-            margin-right: 4px;
-        }
-        .script-line.alex .host-name {
-            color: #3b82f6;
-        }
-        .script-line.sam .host-name {
-            color: #a855f7;
-        }
-        .error {
-            color: #ff4444;
-            padding: 16px;
-            background: #1a1a1a;
-            border-radius: 8px;
-            margin-top: 16px;
-        }
-    </style>
-</head>
-<body>
-    <h1>Huxe Audio</h1>
-    <p class="subtitle">Turn any text or article into a podcast</p>
-
-    <div class="main-container">
-        <div class="input-section">
-            <div class="section-title">Input</div>
-            <form method="POST" id="generateForm">
-                <div class="tabs">
-                    <div class="tab active" onclick="switchTab('text')">Paste Text</div>
-                    <div class="tab" onclick="switchTab('url')">From URL</div>
-                </div>
-
-                <div id="textTab" class="tab-content active">
-                    <textarea name="text" id="textInput" placeholder="Paste your article, news, or any text here...">{{ text or '' }}</textarea>
-                </div>
-
-                <div id="urlTab" class="tab-content">
-                    <input type="url" name="url" id="urlInput" placeholder="https://example.com/article" value="{{ url or '' }}">
-                    <p class="url-hint">Paste any article URL - we'll extract the content automatically</p>
-                </div>
-
-                <input type="hidden" name="input_type" id="inputType" value="text">
-
-                <div class="length-section">
-                    <label class="length-label">Podcast Length</label>
-                    <select name="length" id="lengthSelect">
-                        <option value="short">Short (~1 min)</option>
-                        <option value="medium" selected>Medium (~3 min)</option>
-                        <option value="long">Long (~5 min)</option>
-                    </select>
-                </div>
-
-                <button type="submit" id="submitBtn">Generate Podcast</button>
-            </form>
-
-            {% if error %}
-            <div class="error">{{ error }}</div>
-            {% endif %}
-        </div>
-
-        <div class="result-section">
-            <div class="section-title">Output</div>
-
-            {% if audio_file %}
-            <div class="audio-section">
-                <audio controls autoplay>
-                    <source src="/audio/{{ audio_file }}" type="audio/mpeg">
-                </audio>
-                <a href="/download/{{ audio_file }}" style="text-decoration: none;">
-                    <button type="button" class="download-btn">Download MP3</button>
-                </a>
-            </div>
-
-            {% if script %}
-            <div class="script-section">
-                <div class="section-title">Script</div>
-                <div class="script-container">
-                    {% for line in script_lines %}
-                        {% if line.host == 'alex' %}
-                        <div class="script-line alex">
-                            <span class="host-name">Alex:</span>{{ line.text }}
-                        </div>
-                        {% elif line.host == 'sam' %}
-                        <div class="script-line sam">
-                            <span class="host-name">Sam:</span>{{ line.text }}
-                        </div>
-                        {% endif %}
-                    {% endfor %}
-                </div>
-            </div>
-            {% endif %}
-
-            {% else %}
-            <div class="result-placeholder">
-                <div class="result-placeholder-icon">🎙️</div>
-                <p>Your podcast will appear here</p>
-                <p style="font-size: 14px;">Paste text or URL, then click Generate</p>
-            </div>
-            {% endif %}
-        </div>
-    </div>
-
-    <script>
-        function switchTab(tab) {
-            document.querySelectorAll('.tab').forEach(t => t.classList.remove('active'));
-            document.querySelectorAll('.tab-content').forEach(c => c.classList.remove('active'));
-
-            if (tab === 'text') {
-                document.querySelector('.tab:first-child').classList.add('active');
-                document.getElementById('textTab').classList.add('active');
-                document.getElementById('inputType').value = 'text';
-                document.getElementById('urlInput').value = '';
-            } else {
-                document.querySelector('.tab:last-child').classList.add('active');
-                document.getElementById('urlTab').classList.add('active');
-                document.getElementById('inputType').value = 'url';
-                document.getElementById('textInput').value = '';
-            }
-        }
-
-        document.getElementById('generateForm').onsubmit = function() {
-            document.getElementById('submitBtn').disabled = true;
-            document.getElementById('submitBtn').textContent = 'Generating... (30-60 seconds)';
-        };
-    </script>
-</body>
-</html>
-'''
-
-
-def parse_script_lines(script):
-    """Parse script into structured lines with host identification."""
-    lines = []
-    for line in script.strip().split('\n'):
-        line = line.strip()
-        if not line:
-            continue
-        if line.startswith('Alex:'):
-            lines.append({
-                'host': 'alex',
-                'text': line.replace('Alex:', '').strip()
-            })
-        elif line.startswith('Sam:'):
-            lines.append({
-                'host': 'sam',
-                'text': line.replace('Sam:', '').strip()
-            })
-    return lines
+import re
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from flask import (Blueprint, Flask, Response, abort, current_app, jsonify,
+                   render_template, request, send_file, stream_with_context, url_for)
+
+from admission import AdmissionController, Busy
+from aio import core
+from artifacts import ArtifactStore, ResultIndex, file_digest
+from cache import DiskCache, TieredCache, make_key
+from extract import extract_article
+from fetch import fetch_page, page_cache
+from gemini import GeminiClient, Unavailable
+import jobs
+from jobs import JobQueue, ensure_workers
+from metrics import bytes_total, new_trace, register_stats, span, start_flusher, trace_id
+from metrics import render as render_metrics
+from mp3 import write_segments
+from script import (GENERATION_CONFIG, ScriptError, TurnParser, dump_script,
+                    format_script, parse_script, script_lines)
+from transcode import FORMATS, Transcoder, variant_name
+import tts
+from tts import segment_cache, synthesize_lines, synthesize_stream
+from tts_backends import BACKEND_NAMES, VOICES
+
+bp = Blueprint('huxe', __name__)
+
+# Artifact names are content hashes, so a URL's bytes never change
+ARTIFACT_MAX_AGE = 365 * 24 * 3600
+# How artifact bytes leave the app: '' streams them from the worker,
+# 'x-sendfile' hands the path to Apache/lighttpd, 'x-accel' hands an
+# internal URI under SENDFILE_PREFIX to nginx
+SENDFILE_MODE = os.environ.get('SENDFILE_MODE', '')
+SENDFILE_PREFIX = os.environ.get('SENDFILE_PREFIX', '/protected-artifacts/')
+
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'),
+                    format='%(asctime)s %(levelname)s %(name)s %(message)s')
+logger = logging.getLogger('huxe')
+
+GEMINI_MODEL = os.environ.get('GEMINI_MODEL', 'gemini-2.0-flash')
+model = None  # created by get_model() on first use
+_model_lock = threading.Lock()
+job_queue = JobQueue()
+artifact_store = ArtifactStore()
+# Compact encodings (AUDIO_ENCODINGS) of finished podcasts, made in the background
+transcoder = Transcoder(artifact_store)
+
+# Bump whenever the prompt in build_script_prompt changes so cached
+# scripts written for the old prompt stop being served
+SCRIPT_PROMPT_VERSION = 2
+SCRIPT_ATTEMPTS = 2  # generations per script when Gemini's reply doesn't validate
+SCRIPT_INPUT_CHARS = 4000  # how much of the source text the prompt sees
+MAX_DOCUMENT_CHARS = int(os.environ.get('MAX_DOCUMENT_CHARS', '60000'))
+script_cache = TieredCache(
+    int(os.environ.get('SCRIPT_CACHE_ENTRIES', '256')),
+    DiskCache(os.environ.get('SCRIPT_CACHE_DIR', os.path.join('.cache', 'scripts')),
+              int(os.environ.get('SCRIPT_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+              suffix='.txt'))
+
+# Long documents are condensed chunk by chunk before the dialogue prompt;
+# chunk summaries are cached so an edited document only redoes what changed
+CONDENSE_PROMPT_VERSION = 1
+CHUNK_MIN_CHARS = 1500
+CHUNK_MAX_CHARS = 4000
+CONDENSE_CONCURRENCY = int(os.environ.get('CONDENSE_CONCURRENCY', '4'))
+CONDENSE_MAX_ROUNDS = 3
+# Each chunk is cut to about this fraction of its own length, so its summary
+# (and cache key) doesn't depend on the rest of the document
+CONDENSE_RATIO = 1 / 3
+chunk_cache = TieredCache(
+    int(os.environ.get('CHUNK_CACHE_ENTRIES', '1024')),
+    DiskCache(os.environ.get('CHUNK_CACHE_DIR', os.path.join('.cache', 'chunks')),
+              int(os.environ.get('CHUNK_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+              suffix='.txt'))
+
+# Voice settings (per-host voices live in tts_backends.VOICES); part of the
+# result fingerprint, so changing them stops previously built podcasts from
+# being served
+TTS_LANG = 'en'
+result_index = ResultIndex(
+    artifact_store,
+    os.environ.get('RESULT_INDEX_DIR', os.path.join('.cache', 'results')),
+    int(os.environ.get('RESULT_INDEX_MAX_BYTES', str(64 * 1024 * 1024))))
+
+# Generations running at once and waiting, per process (admission.py).
+# Costs are in medium podcasts: the length preset sets how much dialogue
+# gets synthesized, and inputs longer than the prompt add condense rounds
+admission = AdmissionController()
+LENGTH_COST = {'short': 0.5, 'medium': 1.0, 'long': 1.7}
+CONDENSE_COST = 0.3  # per round of CONDENSE_CONCURRENCY chunk summaries
+BUSY_MESSAGE = "🚦 Lots of podcasts are being made right now. Please try again in {} seconds."
+LENGTH_MESSAGE = f"Length must be one of: {', '.join(LENGTH_COST)}."
+
+register_stats('huxe_segment_cache', 'TTS segment cache counters.', segment_cache.stats)
+register_stats('huxe_script_cache', 'Script cache counters.', script_cache.stats)
+register_stats('huxe_chunk_cache', 'Condensed chunk cache counters.', chunk_cache.stats)
+register_stats('huxe_page_cache', 'Fetched page cache counters.', page_cache.stats)
+register_stats('huxe_result_index', 'Finished podcast index counters.', result_index.stats)
+register_stats('huxe_transcode', 'Compact encodings made, failed and their size ratio.',
+               transcoder.stats, label='stat')
+register_stats('huxe_admission', 'Generations admitted, queued and shed, and the queue.',
+               admission.stats, label='stat')
+register_stats('huxe_async_core', 'Pipelines in flight on the async core.', core.stats,
+               label='stat')
+register_stats('huxe_tts_backend', 'TTS engine latency and error-rate averages.',
+               lambda: getattr(tts.default_backend, 'stats', dict)(),
+               label='stat')
+
+
+def get_model():
+    """The Gemini model, created on first use.
+
+    Importing the SDK is most of the app's import time, so it happens here
+    rather than at startup. Tests and benchmarks can assign `model` instead.
+    """
+    global model
+    with _model_lock:
+        if model is None:
+            import google.generativeai as genai  # type: ignore
+
+            genai.configure(api_key=os.environ.get('GEMINI_API_KEY'))
+            model = genai.GenerativeModel(GEMINI_MODEL)
+        return model
+
+
+# All model calls go through this: adaptive concurrency, retries, breaker
+gemini = GeminiClient(get_model)
+register_stats('huxe_gemini', 'Gemini client calls, retries and adaptive limit.', gemini.stats,
+               label='stat')
+
+
+# Libraries that are otherwise imported on first use. preload() imports them
+# up front for gunicorn's preload_app: the workers then share them
+# copy-on-write, and clients, threads and the event loop are still created
+# in each worker after the fork
+PRELOAD_MODULES = ('google.generativeai', 'gtts', 'requests')
+
+
+def preload():
+    """Import the heavy client libraries without creating any clients."""
+    for name in PRELOAD_MODULES:
+        importlib.import_module(name)
+
+
+def create_app():
+    """Build the Flask app. Shared state (caches, stores, queue) is per process."""
+    app = Flask(__name__)
+    app.config['USE_X_SENDFILE'] = SENDFILE_MODE == 'x-sendfile'
+    # Static URLs carry a content hash (see static_url), so they can be
+    # cached as long as artifacts
+    app.config['SEND_FILE_MAX_AGE_DEFAULT'] = ARTIFACT_MAX_AGE
+    app.register_blueprint(bp)
+    return app
+
+
+static_versions = {}
+
+
+@bp.app_template_global()
+def static_url(filename):
+    """URL of a static file with its content hash appended, for cache busting."""
+    version = static_versions.get(filename)
+    if version is None:
+        version = file_digest(os.path.join(current_app.static_folder, filename))[:12]
+        static_versions[filename] = version
+    return url_for('static', filename=filename, v=version)
+
+
+@bp.app_template_global()
+def audio_sources(filename):
+    """Player sources for a podcast: Opus-type encodings first, then the MP3.
+
+    Browsers take the first type they can play. Encodings that are MP3
+    themselves aren't listed, since /audio already serves them as the MP3.
+    """
+    sources = []
+    if transcoder.available():
+        for encoding in transcoder.encodings:
+            mimetype = FORMATS[encoding].mimetype
+            if not mimetype.startswith('audio/mpeg'):
+                sources.append({'url': f'/audio/{filename}?format={encoding}',
+                                'type': mimetype})
+    sources.append({'url': f'/audio/{filename}', 'type': 'audio/mpeg'})
+    return sources
 
 
 def extract_text_from_url(url):
     """Fetch webpage and extract article text."""
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-
-        soup = BeautifulSoup(response.text, 'html.parser')
-
-        # Remove unwanted elements
-        for tag in soup(['script', 'style', 'nav', 'header', 'footer', 'aside',
-                         'form', 'button', 'iframe', 'noscript']):
-            tag.decompose()
-
-        # Try to find main content
-        article = soup.find('article') or soup.find('main') or soup.find('body')
-
-        if article:
-            # Get text and clean it up
-            text = article.get_text(separator=' ', strip=True)
-            # Remove extra whitespace
-            text = ' '.join(text.split())
-            return text
-
-        return None
-    except Exception as e:
+        html = fetch_page(url)
+        # Longer documents get condensed, but nothing past this is used
+        return extract_article(html, limit=MAX_DOCUMENT_CHARS)
+    except Exception:
         return None
 
 
-def create_podcast_script(text, length='medium'):
-    """Use Gemini to convert text into a 2-host podcast conversation."""
+def build_script_prompt(text, length='medium'):
+    """Build the Gemini prompt for a 2-host podcast conversation."""
     # Length settings: word count targets
     length_config = {
         'short': {'words': 150, 'duration': '1 minute'},
@@ -432,11 +222,11 @@ HOSTS:
 - Sam (female): The explainer. Makes complex things simple. Uses "okay so here's the thing..." and "honestly though...". Laughs easily.
 
 DIALOGUE TECHNIQUES (USE THESE!):
-- Interruptions with "—": "Alex: And the thing is— Sam: —exactly what I was thinking!"
+- Interruptions with "—": Alex: "And the thing is—" then Sam: "—exactly what I was thinking!"
 - Trailing off with "...": "Sam: I mean, it's kind of..."
 - Reactions BEFORE explanations: "Oh wow! So basically..." not just "So basically..."
 - Filler words: "like", "honestly", "I mean", "you know", "right?"
-- One host finishing other's thought: "Alex: So it's like— Sam: —a game changer, yeah."
+- One host finishing other's thought: Alex: "So it's like—" then Sam: "—a game changer, yeah."
 - Short rapid exchanges mixed with longer explanations
 - Express emotions: surprise, confusion, humor, excitement
 - Rhetorical questions: "Can you even imagine?", "Wild, right?"
@@ -456,68 +246,289 @@ STRUCTURE:
 
 FORMAT:
 - TARGET LENGTH: Around {config['words']} words ({config['duration']} when spoken)
-- Every line must start with "Alex: " or "Sam: "
+- Reply with JSON: {{"turns": [{{"host": "Alex" or "Sam", "text": "what they say"}}, ...]}}
+- A new turn every time the speaker changes, including interruptions
 - No stage directions, no parentheses, just dialogue
 
 EXAMPLE OF GOOD FLOW:
-Alex: Okay wait, I have to tell you about this thing I just read—
-Sam: Oh no, what now? *laughs*
-Alex: No no, it's actually cool! So apparently...
-Sam: Wait, seriously? That's...
-Alex: Right?! And here's the wild part—
-Sam: —there's more?
-Alex: So much more.
+{{"turns": [
+  {{"host": "Alex", "text": "Okay wait, I have to tell you about this thing I just read—"}},
+  {{"host": "Sam", "text": "Oh no, what now?"}},
+  {{"host": "Alex", "text": "No no, it's actually cool! So apparently..."}},
+  {{"host": "Sam", "text": "Wait, seriously? That's..."}},
+  {{"host": "Alex", "text": "Right?! And here's the wild part—"}},
+  {{"host": "Sam", "text": "—there's more?"}},
+  {{"host": "Alex", "text": "So much more."}}
+]}}
 
 NOW CREATE A CONVERSATION ABOUT THIS:
-{text[:4000]}"""
-
-    response = model.generate_content(prompt)
-    return response.text
+{text[:SCRIPT_INPUT_CHARS]}"""
 
+    return prompt
 
-def generate_audio(script):
-    """Convert podcast script to audio using gTTS."""
-    lines = script.strip().split('\n')
-    audio_files = []
 
-    for i, line in enumerate(lines):
-        line = line.strip()
-        if not line:
-            continue
+def split_chunks(text, min_chars=CHUNK_MIN_CHARS, max_chars=CHUNK_MAX_CHARS):
+    """Split text into chunks on paragraph (or, failing that, sentence) boundaries.
 
-        if line.startswith("Alex:"):
-            text = line.replace("Alex:", "").strip()
-            tld = 'us'  # American accent for Alex
-        elif line.startswith("Sam:"):
-            text = line.replace("Sam:", "").strip()
-            tld = 'co.uk'  # British accent for Sam
+    Chunk ends are picked from the content itself (a checksum of the unit
+    that closes it) rather than by packing to a fixed size, so editing one
+    paragraph only moves the boundaries right around it.
+    """
+    units = []
+    for paragraph in re.split(r'\n\s*\n', text):
+        paragraph = paragraph.strip()
+        if len(paragraph) <= max_chars:
+            units.append(paragraph)
         else:
-            continue
+            units.extend(re.split(r'(?<=[.!?])\s+', paragraph))
+
+    chunks = []
+    current = []
+    size = 0
+    for unit in filter(None, units):
+        if current and size + len(unit) > max_chars:
+            chunks.append('\n\n'.join(current))
+            current, size = [], 0
+        current.append(unit[:max_chars])
+        size += len(unit)
+        if size >= min_chars and zlib.crc32(unit.encode('utf-8')) % 4 == 0:
+            chunks.append('\n\n'.join(current))
+            current, size = [], 0
+    if current:
+        chunks.append('\n\n'.join(current))
+    return chunks
+
+
+def condense_chunk(chunk):
+    """Summarize one chunk with Gemini, cached by the chunk's content."""
+    # ~6 characters per word
+    words = max(40, int(len(chunk) * CONDENSE_RATIO) // 6)
+
+    def generate():
+        prompt = f"""Condense this section of a longer document into about {words} words of plain prose.
+Keep the concrete facts, numbers, names, surprises and any quotable lines. No headings, no bullet points, no commentary.
+
+SECTION:
+{chunk}"""
+        return gemini.generate_content(prompt).text.strip()
+
+    key = make_key(CONDENSE_PROMPT_VERSION, words, chunk)
+    return chunk_cache.get_or_create(key, generate)
+
+
+def condense_document(text):
+    """Map-reduce a long document down to what fits in the dialogue prompt.
+
+    Every round condenses each chunk on its own, and rounds repeat until the
+    whole fits, so an edit only redoes the chunks it touched.
+    """
+    text = text[:MAX_DOCUMENT_CHARS]
+    for _ in range(CONDENSE_MAX_ROUNDS):
+        if len(text) <= SCRIPT_INPUT_CHARS:
+            break
+        chunks = split_chunks(text)
+        with span('condense'), ThreadPoolExecutor(max_workers=CONDENSE_CONCURRENCY) as pool:
+            summaries = list(pool.map(
+                lambda chunk: contextvars.copy_context().run(condense_chunk, chunk),
+                chunks))
+        text = '\n\n'.join(summaries)
+    return text
+
+
+def script_cache_key(text, length):
+    """Scripts only depend on the prompt version, the length and the prompt input."""
+    return make_key(SCRIPT_PROMPT_VERSION, length, text[:SCRIPT_INPUT_CHARS])
 
-        if text:
-            filename = f"temp_audio_{i}.mp3"
-            tts = gTTS(text=text, lang='en', tld=tld)
-            tts.save(filename)
-            audio_files.append(filename)
 
-    return audio_files
+def create_podcast_script(text, length='medium'):
+    """Use Gemini to convert text into a 2-host conversation, as a tuple of Turns."""
+    text = condense_document(text)
+
+    def generate():
+        for attempt in range(SCRIPT_ATTEMPTS):
+            response = gemini.generate_content(build_script_prompt(text, length),
+                                                generation_config=GENERATION_CONFIG)
+            try:
+                # Validated before caching, so a bad reply is never served again
+                return dump_script(parse_script(response.text))
+            except ScriptError as e:
+                if attempt == SCRIPT_ATTEMPTS - 1:
+                    raise
+                logger.warning('Discarding unusable script: %s', e)
+
+    return parse_script(script_cache.get_or_create(script_cache_key(text, length), generate))
+
+
+def stream_podcast_script(text, length='medium'):
+    """Like create_podcast_script, but yield each Turn as soon as it is complete."""
+    text = condense_document(text)
+    key = script_cache_key(text, length)
+    cached = script_cache.get(key)
+    if cached is not None:
+        yield from parse_script(cached)
+        return
+
+    response = gemini.generate_content(build_script_prompt(text, length),
+                                        generation_config=GENERATION_CONFIG,
+                                        stream=True)
+    parser = TurnParser()
+    for chunk in response:
+        yield from parser.feed(chunk.text)
+    script_cache.put(key, dump_script(parser.close()))
+
+
+async def generate_audio(turns, backend=None, on_progress=None, scheduler=None):
+    """Convert script turns to in-memory MP3 segments, in parallel."""
+    segments = [(turn.text, turn.host) for turn in turns]
+    return await synthesize_lines(segments, backend=backend, lang=TTS_LANG,
+                                  on_progress=on_progress, scheduler=scheduler)
+
+
+def combine_audio_files(segments, output_file):
+    """Concatenate already-stripped MP3 segments into one file."""
+    with open(output_file, 'wb') as outfile:
+        write_segments(segments, outfile)
 
 
-def combine_audio_files(audio_files, output_file):
-    """Combine multiple audio files into one."""
-    with open(output_file, 'wb') as outfile:
-        for audio in audio_files:
-            if os.path.exists(audio):
-                with open(audio, 'rb') as infile:
-                    outfile.write(infile.read())
+def store_podcast(segments, workdir):
+    """Combine segments in `workdir` and move the file into the artifact store."""
+    combined = os.path.join(workdir, 'podcast.mp3')
+    with span('combine'):
+        combine_audio_files(segments, combined)
+    bytes_total.inc('combine', amount=os.path.getsize(combined))
+    return artifact_store.store(combined)
+
+
+def result_key(text, length):
+    """Fingerprint of everything that decides what a finished podcast sounds like.
+
+    URL inputs are keyed on the extracted text, not the URL, so a page
+    that changes gets a new podcast.
+    """
+    return make_key(SCRIPT_PROMPT_VERSION, TTS_LANG, BACKEND_NAMES,
+                    json.dumps(VOICES, sort_keys=True), length, ' '.join(text.split()))
+
+
+class PipelineError(Exception):
+    """A pipeline stage failed; the message is safe to show to the user."""
+
+
+def estimate_cost(text, length):
+    """Admission cost of a generation, from its length preset and input size."""
+    cost = LENGTH_COST.get(length, LENGTH_COST['medium'])
+    if len(text) > SCRIPT_INPUT_CHARS:
+        chunks = min(len(text), MAX_DOCUMENT_CHARS) // CHUNK_MAX_CHARS + 1
+        cost += CONDENSE_COST * math.ceil(chunks / CONDENSE_CONCURRENCY)
+    return cost
+
+
+def run_pipeline(text, length='medium', url=None, progress=None, shed=True):
+    """Run the pipeline on the async core, blocking until it finishes."""
+    return core.run(run_pipeline_async(text, length, url=url, progress=progress, shed=shed))
+
+
+async def run_pipeline_async(text, length='medium', url=None, progress=None, shed=True,
+                             tts_scheduler=None):
+    """Run extract -> script -> TTS -> combine and describe the result.
+
+    `progress`, if given, is called with the name of each stage as it starts,
+    and with (stage, done, total) as TTS lines finish. Blocking stages are
+    offloaded to the core's executor, so many pipelines can wait at once.
+    Repeats are answered from the result index; anything else waits for an
+    admission slot, or with `shed` raises Busy if the wait would be too long.
+    `tts_scheduler` is a tts.Scheduler shared with other pipelines.
+    """
+    def report(stage, done=None, total=None):
+        if progress:
+            progress(stage, done, total)
+
+    # URLs are fetched first (revalidated through the page cache), so the
+    # result index sees what the page says now
+    if url:
+        report('fetching')
+        with span('fetch'):
+            text = await core.offload(extract_text_from_url, url)
+        if not text:
+            raise PipelineError("🔗 Couldn't read that article. The site might be blocking access or the page structure is unusual. Try a different URL or paste the text directly.")
+
+    # A repeat of the same input is served straight from the result index
+    key = result_key(text or '', length)
+    cached = await core.offload(result_index.get, key)
+    if cached:
+        return cached
+
+    async with admission.slot(estimate_cost(text or '', length), shed=shed):
+        result = await generate_podcast(text, length, report, tts_scheduler)
+    await core.offload(result_index.put, key, result)
+    return result
+
+
+async def generate_podcast(text, length, report, tts_scheduler=None):
+    """The pipeline stages of run_pipeline_async after the fetch, once admitted."""
+    if len(text or '') < 50:
+        raise PipelineError("📄 Not enough content (need at least 50 characters). Try adding more text or a different source.")
+
+    # Step 1: Generate script with AI
+    report('script')
+    try:
+        with span('script'):
+            turns = await core.offload(create_podcast_script, text, length)
+    except Unavailable:
+        raise PipelineError("🤖 The AI service is overloaded right now. Please try again in a minute.")
+    except Exception:
+        raise PipelineError("🤖 AI couldn't generate a script. This might be due to content restrictions or API limits. Try different or shorter content.")
+
+    with artifact_store.workdir() as workdir:
+        # Step 2: Convert script to audio
+        report('audio')
+        try:
+            with span('tts'):
+                segments = await generate_audio(
+                    turns, on_progress=lambda done, total: report('audio', done, total),
+                    scheduler=tts_scheduler)
+        except Exception:
+            raise PipelineError("🔊 Voice generation failed. This could be a temporary issue with the text-to-speech service. Please try again.")
+        if not segments:
+            raise PipelineError("🔊 Voice generation produced no audio. The script might be empty or in an unexpected format. Try again.")
+
+        # Step 3: Combine audio files
+        report('combining')
+        try:
+            output_file = await core.offload(store_podcast, segments, workdir)
+        except Exception:
+            raise PipelineError("🎧 Failed to combine audio files. Please try again.")
+        transcoder.submit(output_file)
+
+    return {
+        'audio_file': output_file,
+        'script': format_script(turns),
+        'script_lines': script_lines(turns),
+    }
+
+
+@bp.before_app_request
+def start_trace():
+    new_trace()
+    # Started from the first request rather than at import, so a preloaded
+    # master never runs it and each worker gets its own. Finished jobs go
+    # with their audio, so old job results never point at a 404
+    artifact_store.start_sweeper(also=lambda: job_queue.prune(artifact_store.ttl))
+    start_flusher()
+
+
+@bp.after_app_request
+def add_trace_header(response):
+    response.headers['X-Trace-Id'] = trace_id.get()
+    return response
 
-    # Clean up temp files
-    for audio in audio_files:
-        if os.path.exists(audio):
-            os.remove(audio)
 
+@bp.route('/metrics')
+def metrics():
+    """Prometheus text exposition of stage timings, bytes and cache stats."""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
 
-@app.route('/', methods=['GET', 'POST'])
+
+@bp.route('/', methods=['GET', 'POST'])
 def index():
     if request.method == 'POST':
         input_type = request.form.get('input_type', 'text')
@@ -527,99 +538,427 @@ def index():
         if input_type == 'url':
             url = request.form.get('url', '').strip()
             if not url:
-                return render_template_string(HTML_TEMPLATE,
-                                              error="📝 Please enter a URL to continue.")
-
-            text = extract_text_from_url(url)
-            if not text:
-                return render_template_string(HTML_TEMPLATE,
-                                              error="🔗 Couldn't read that article. The site might be blocking access or the page structure is unusual. Try a different URL or paste the text directly.",
-                                              url=url)
+                return render_template('index.html',
+                                       error="📝 Please enter a URL to continue.")
+            # Fetched inside run_pipeline, which keys the result on the page text
         else:
             text = request.form.get('text', '').strip()
             if not text:
-                return render_template_string(HTML_TEMPLATE,
-                                              error="📝 Please enter some text to continue.")
+                return render_template('index.html',
+                                       error="📝 Please enter some text to continue.")
 
-        if len(text) < 50:
-            return render_template_string(
-                HTML_TEMPLATE,
+        if input_type == 'text' and len(text) < 50:
+            return render_template(
+                'index.html',
                 error="📄 Not enough content (need at least 50 characters). Try adding more text or a different source.",
                 text=text if input_type == 'text' else '',
                 url=url if input_type == 'url' else '')
 
         # Get selected length
         length = request.form.get('length', 'medium')
+        if length not in LENGTH_COST:
+            return render_template(
+                'index.html',
+                error=f"📏 {LENGTH_MESSAGE}",
+                text=text if input_type == 'text' else '',
+                url=url if input_type == 'url' else ''), 400
 
         # Check if API key is configured
         if not os.environ.get('GEMINI_API_KEY'):
-            return render_template_string(
-                HTML_TEMPLATE,
+            return render_template(
+                'index.html',
                 error="⚠️ Gemini API key not configured. Please set the GEMINI_API_KEY environment variable.",
                 text=text if input_type == 'text' else '',
                 url=url if input_type == 'url' else '')
 
-        # Step 1: Generate script with AI
         try:
-            script = create_podcast_script(text, length)
-        except Exception:
-            return render_template_string(
-                HTML_TEMPLATE,
-                error="🤖 AI couldn't generate a script. This might be due to content restrictions or API limits. Try different or shorter content.",
+            result = run_pipeline(text, length, url=url or None)
+        except Busy as e:
+            return render_template(
+                'index.html',
+                error=BUSY_MESSAGE.format(e.retry_after),
                 text=text if input_type == 'text' else '',
-                url=url if input_type == 'url' else '')
-
-        # Step 2: Convert script to audio
-        try:
-            audio_files = generate_audio(script)
-            if not audio_files:
-                return render_template_string(
-                    HTML_TEMPLATE,
-                    error="🔊 Voice generation produced no audio. The script might be empty or in an unexpected format. Try again.",
-                    text=text if input_type == 'text' else '',
-                    url=url if input_type == 'url' else '')
-        except Exception:
-            return render_template_string(
-                HTML_TEMPLATE,
-                error="🔊 Voice generation failed. This could be a temporary issue with the text-to-speech service. Please try again.",
+                url=url if input_type == 'url' else ''), 503, {'Retry-After': str(e.retry_after)}
+        except PipelineError as e:
+            return render_template(
+                'index.html',
+                error=str(e),
                 text=text if input_type == 'text' else '',
                 url=url if input_type == 'url' else '')
 
-        # Step 3: Combine audio files
-        try:
-            output_file = "podcast_output.mp3"
-            combine_audio_files(audio_files, output_file)
-        except Exception:
-            return render_template_string(
-                HTML_TEMPLATE,
-                error="🎧 Failed to combine audio files. Please try again.",
-                text=text if input_type == 'text' else '',
-                url=url if input_type == 'url' else '')
-
-        # Parse script for display
-        script_lines = parse_script_lines(script)
-
-        return render_template_string(HTML_TEMPLATE,
-                                      audio_file=output_file,
-                                      script=script,
-                                      script_lines=script_lines,
-                                      text=text if input_type == 'text' else '',
-                                      url=url if input_type == 'url' else '')
+        return render_template('index.html',
+                               audio_file=result['audio_file'],
+                               script=result['script'],
+                               script_lines=result['script_lines'],
+                               text=text if input_type == 'text' else '',
+                               url=url if input_type == 'url' else '')
+
+    return render_template('index.html')
+
+
+# Pending streaming jobs live in the shared job table, so the GET can land
+# on a different gunicorn worker than the POST
+STREAM_JOB_TTL = 600  # seconds
+
+
+@bp.route('/stream', methods=['POST'])
+def start_stream():
+    """Register a streaming job and return the URL the player should load.
+
+    API only: the page itself goes through /api/jobs for progress and the
+    script.
+    """
+    length = request.form.get('length', 'medium')
+    if length not in LENGTH_COST:
+        return jsonify(error=LENGTH_MESSAGE), 400
+    input_type = request.form.get('input_type', 'text')
+    if input_type == 'url':
+        url = request.form.get('url', '').strip()
+        if not url:
+            return jsonify(error="Please enter a URL to continue."), 400
+        text = extract_text_from_url(url)
+        if not text:
+            return jsonify(error="Couldn't read that article."), 400
+    else:
+        text = request.form.get('text', '').strip()
+
+    if len(text) < 50:
+        return jsonify(error="Not enough content (need at least 50 characters)."), 400
+    if not os.environ.get('GEMINI_API_KEY'):
+        return jsonify(error="Gemini API key not configured."), 500
+
+    job_id = job_queue.enqueue({'text': text, 'length': length}, status='stream')
+    return jsonify(job_id=job_id, stream_url=f'/stream/{job_id}')
+
+
+@bp.route('/stream/<job_id>')
+def stream_audio(job_id):
+    """Stream MP3 audio turn by turn while the script is still being written."""
+    job = job_queue.take(job_id, 'stream', STREAM_JOB_TTL)
+    if job is None:
+        abort(404)
+    text, length = job['text'], job['length']
+    try:
+        ticket = core.run(admission.admit(estimate_cost(text, length)))
+    except Busy as e:
+        # Hand the job back so the retry that Retry-After asks for finds it
+        job_queue.update(job_id, status='stream', stage='stream')
+        return busy_response(e.retry_after)
+
+    turns = ((turn.text, turn.host) for turn in stream_podcast_script(text, length))
+    response = Response(stream_with_context(synthesize_stream(turns)),
+                        mimetype='audio/mpeg',
+                        headers={'Cache-Control': 'no-store'})
+    # The slot is held until the stream is done or the player goes away;
+    # listening speed isn't generation time, so it isn't measured
+    response.call_on_close(lambda: admission.release(ticket, completed=False))
+    return response
+
+
+@bp.route('/api/jobs', methods=['POST'])
+def create_job():
+    """Queue a podcast generation and return its job ID immediately."""
+    data = request.get_json(silent=True) or request.form
+    if not isinstance(data, dict):
+        return jsonify(error="The request body must be a JSON object."), 400
+    for field in ('url', 'text'):
+        if not isinstance(data.get(field) or '', str):
+            return jsonify(error=f"'{field}' must be a string."), 400
+    length = data.get('length', 'medium')
+    if not isinstance(length, str) or length not in LENGTH_COST:
+        return jsonify(error=LENGTH_MESSAGE), 400
+    url = (data.get('url') or '').strip()
+    text = (data.get('text') or '').strip()
+    # The page's form posts both fields; input_type says which one counts
+    if data.get('input_type') == 'url':
+        text = ''
+    elif data.get('input_type') == 'text':
+        url = ''
+    if not url and len(text) < 50:
+        return jsonify(error="Provide a url, or text of at least 50 characters."), 400
+    if not os.environ.get('GEMINI_API_KEY'):
+        return jsonify(error="Gemini API key not configured."), 500
+
+    queued = job_queue.queued()
+    if queued >= jobs.MAX_QUEUED:
+        # About how long the worker pool needs to work through the backlog
+        pool = max(1, jobs.WORKERS * jobs.JOB_CONCURRENCY)
+        return busy_response(max(1, math.ceil(queued * admission.unit_seconds / pool)))
+
+    ensure_workers()
+    job_id = job_queue.enqueue({'text': text, 'url': url or None,
+                                'length': length})
+    return jsonify(job_id=job_id, status_url=f'/api/jobs/{job_id}'), 202
+
+
+def busy_response(retry_after):
+    """503 for API clients turned away by admission control."""
+    return (jsonify(error=BUSY_MESSAGE.format(retry_after), retry_after=retry_after),
+            503, {'Retry-After': str(retry_after)})
+
+
+def public_result(result):
+    """What API clients see of a run_pipeline result."""
+    return {
+        'audio_url': f"/audio/{result['audio_file']}",
+        'download_url': f"/download/{result['audio_file']}",
+        'audio_sources': audio_sources(result['audio_file']),
+        'script_lines': result['script_lines'],
+    }
 
-    return render_template_string(HTML_TEMPLATE)
 
+@bp.route('/api/podcast', methods=['POST'])
+def create_podcast():
+    """Generate a podcast and return its script lines and audio URL as JSON.
+
+    The synchronous counterpart of /api/jobs, for clients that would rather
+    hold the request open than poll. Body: {"text" | "url", "length"}.
+    """
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify(error="The request body must be a JSON object."), 400
+    for field in ('url', 'text'):
+        if not isinstance(data.get(field) or '', str):
+            return jsonify(error=f"'{field}' must be a string."), 400
+    length = data.get('length', 'medium')
+    if not isinstance(length, str) or length not in LENGTH_COST:
+        return jsonify(error=LENGTH_MESSAGE), 400
+    url = (data.get('url') or '').strip()
+    text = '' if url else (data.get('text') or '').strip()
+    if not url and len(text) < 50:
+        return jsonify(error="Provide a url, or text of at least 50 characters."), 400
+    if not os.environ.get('GEMINI_API_KEY'):
+        return jsonify(error="Gemini API key not configured."), 500
 
-@app.route('/audio/<filename>')
+    try:
+        result = run_pipeline(text, length, url=url or None)
+    except Busy as e:
+        return busy_response(e.retry_after)
+    except PipelineError as e:
+        return jsonify(error=str(e)), 502
+    return jsonify(public_result(result))
+
+
+def job_payload(job):
+    """Public view of a job for the status API and progress events."""
+    result = public_result(job['result']) if job['result'] else None
+    return {'id': job['id'], 'status': job['status'], 'stage': job['stage'],
+            'progress': job['progress'], 'error': job['error'], 'result': result}
+
+
+@bp.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    """Report a job's status, current stage and, once done, its result."""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify(error="Unknown job."), 404
+    return jsonify(job_payload(job))
+
+
+EVENT_POLL_INTERVAL = 0.5  # seconds between job store reads
+EVENT_HEARTBEAT = 15  # seconds between keep-alive comments
+
+
+@bp.route('/api/jobs/<job_id>/events')
+def job_events(job_id):
+    """Server-sent events for a job: one `progress` event per change, then
+    a final `done` or `failed` event with the job payload."""
+    if job_queue.get(job_id) is None:
+        return jsonify(error="Unknown job."), 404
+
+    def events():
+        last = None
+        last_sent = time.monotonic()
+        while True:
+            job = job_queue.get(job_id)
+            payload = job_payload(job)
+            if job['status'] in ('done', 'failed'):
+                yield f"event: {job['status']}\ndata: {json.dumps(payload)}\n\n"
+                return
+            state = (job['status'], job['stage'], json.dumps(job['progress']))
+            if state != last:
+                last = state
+                last_sent = time.monotonic()
+                yield f"event: progress\ndata: {json.dumps(payload)}\n\n"
+            elif time.monotonic() - last_sent > EVENT_HEARTBEAT:
+                last_sent = time.monotonic()
+                yield ': keep-alive\n\n'
+            time.sleep(EVENT_POLL_INTERVAL)
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', '50'))
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', '4'))
+
+
+@bp.route('/api/batch', methods=['POST'])
+def batch():
+    """Generate podcasts for many texts/URLs in one request.
+
+    Body: {"items": [{"url": ...} | {"text": ...} | "<url or text>"],
+           "length": "short|medium|long", "concurrency": N}
+
+    Identical inputs are generated once. Up to `concurrency` documents
+    (capped at BATCH_CONCURRENCY) run on the async core at a time. All their
+    lines go through one TTS scheduler, longest first, with TTS_MAX_WORKERS
+    sentences in flight per running document. Results stream back as newline-delimited JSON, one
+    line per item, in completion order.
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        return jsonify(error="Provide a non-empty 'items' list."), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify(error=f"At most {BATCH_MAX_ITEMS} items per batch."), 400
+    if not os.environ.get('GEMINI_API_KEY'):
+        return jsonify(error="Gemini API key not configured."), 500
+    length = data.get('length', 'medium')
+    if not isinstance(length, str) or length not in LENGTH_COST:
+        return jsonify(error=LENGTH_MESSAGE), 400
+    try:
+        concurrency = max(1, min(int(data.get('concurrency', BATCH_CONCURRENCY)),
+                                 BATCH_CONCURRENCY))
+    except (TypeError, ValueError):
+        return jsonify(error="'concurrency' must be a number."), 400
+
+    # Group duplicate inputs so each distinct document is generated once
+    documents = {}
+    for index, item in enumerate(items):
+        if isinstance(item, str):
+            item = {'url': item} if item.startswith(('http://', 'https://')) else {'text': item}
+        if not isinstance(item, dict):
+            return jsonify(error=f"Item {index} must be a string or an object."), 400
+        for field in ('url', 'text'):
+            if not isinstance(item.get(field) or '', str):
+                return jsonify(error=f"Item {index}: '{field}' must be a string."), 400
+        url = (item.get('url') or '').strip() or None
+        text = '' if url else (item.get('text') or '').strip()
+        # URLs are keyed on their content once fetched; here they group by URL
+        key = url or result_key(text, length)
+        documents.setdefault(key, {'text': text, 'url': url, 'indices': []})['indices'].append(index)
+
+    async def generate(doc, slots, scheduler):
+        async with slots:
+            # Queued rather than shed: the batch already holds its request
+            return await run_pipeline_async(doc['text'], length, url=doc['url'], shed=False,
+                                            tts_scheduler=scheduler)
+
+    def results():
+        slots = asyncio.Semaphore(concurrency)
+        scheduler = tts.Scheduler(tts.MAX_WORKERS * concurrency)
+        futures = {core.submit(generate(doc, slots, scheduler)): doc
+                   for doc in documents.values()}
+        try:
+            for future in as_completed(futures):
+                doc = futures[future]
+                try:
+                    payload = {'status': 'done', 'result': public_result(future.result())}
+                except PipelineError as e:
+                    payload = {'status': 'failed', 'error': str(e)}
+                except Exception:
+                    payload = {'status': 'failed',
+                               'error': "Something went wrong while generating the podcast. Please try again."}
+                for index in doc['indices']:
+                    yield json.dumps({'index': index, **payload}) + '\n'
+        finally:
+            # Client went away: stop the documents that haven't finished
+            for future in futures:
+                future.cancel()
+
+    return Response(stream_with_context(results()), mimetype='application/x-ndjson')
+
+
+def pick_encoding(filename, negotiate=True):
+    """The stored name to send for `filename`, and whether it is final.
+
+    ?format=<encoding> (or 'original') chooses explicitly. Otherwise, with
+    `negotiate`, the first AUDIO_ENCODINGS entry the client can take wins:
+    MP3 ones always, others only when Accept names their type at least as
+    strongly as audio/mpeg, so clients sending */* keep getting an MP3
+    every player can handle. If the chosen encoding isn't made yet it is
+    queued and the original goes out in the meantime, marked not final.
+    """
+    if not transcoder.available() or '-' in filename:
+        return filename, True
+    wanted = request.args.get('format')
+    if wanted is None and negotiate:
+        accept = request.accept_mimetypes
+        named = {value for value, _ in accept}
+        for encoding in transcoder.encodings:
+            mimetype = FORMATS[encoding].mimetype.split(';')[0]
+            if mimetype == 'audio/mpeg' or (
+                    mimetype in named and accept[mimetype] >= accept['audio/mpeg']):
+                wanted = encoding
+                break
+    if wanted not in transcoder.encodings:
+        return filename, True
+    variant = variant_name(filename, wanted)
+    if artifact_store.path(variant):
+        return variant, True
+    if artifact_store.path(filename):
+        transcoder.submit(filename, [wanted])
+    return filename, False
+
+
+def send_artifact(filename, download_name=None, final=True):
+    """Serve a stored artifact with range support and immutable caching.
+
+    The ETag is the content hash in the name, so it is strong and costs no
+    disk read. In x-accel mode only the headers are sent and nginx serves
+    the bytes (ranges included) from SENDFILE_PREFIX. A response that isn't
+    `final` (a stand-in for an encoding still being made) must be
+    revalidated, so caches pick the encoding up once it exists.
+    """
+    path = artifact_store.path(filename)
+    if path is None:
+        abort(404)
+    etag = filename.rsplit('.', 1)[0]
+
+    if SENDFILE_MODE == 'x-accel':
+        response = Response(status=200, mimetype=mimetypes.guess_type(filename)[0])
+        response.set_etag(etag)
+        if request.if_none_match.contains(etag):
+            response.status_code = 304
+        else:
+            response.headers['X-Accel-Redirect'] = SENDFILE_PREFIX + filename
+            if download_name:
+                response.headers['Content-Disposition'] = (
+                    f'attachment; filename="{download_name}"')
+    else:
+        # conditional=True answers If-None-Match/If-Range and Range (206)
+        response = send_file(path, as_attachment=bool(download_name),
+                             download_name=download_name, etag=etag,
+                             conditional=True, max_age=ARTIFACT_MAX_AGE)
+    response.cache_control.public = True
+    if final:
+        response.cache_control.max_age = ARTIFACT_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.max_age = 0
+        response.cache_control.no_cache = True
+    return response
+
+
+@bp.route('/audio/<filename>')
 def serve_audio(filename):
-    return send_file(filename, mimetype='audio/mpeg')
+    name, final = pick_encoding(filename)
+    response = send_artifact(name, final=final)
+    if 'format' not in request.args and transcoder.available():
+        response.vary.add('Accept')
+    return response
 
 
-@app.route('/download/<filename>')
+@bp.route('/download/<filename>')
 def download_audio(filename):
-    return send_file(filename,
-                     as_attachment=True,
-                     download_name='huxe_podcast.mp3')
+    # Only ?format= picks a download's encoding; Accept is for players
+    name, final = pick_encoding(filename, negotiate=False)
+    return send_artifact(name, download_name='huxe_podcast.' + name.rsplit('.', 1)[1],
+                         final=final)
+
 
+app = create_app()
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5001, debug=True)
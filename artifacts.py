@@ -0,0 +1,182 @@
+"""Per-job working directories and a content-addressed store for podcasts."""
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from cache import DiskCache
+
+logger = logging.getLogger('huxe')
+
+ARTIFACT_DIR = os.environ.get('ARTIFACT_DIR', 'artifacts')
+ARTIFACT_TTL = int(os.environ.get('ARTIFACT_TTL', str(24 * 3600)))  # seconds
+ARTIFACT_MAX_BYTES = int(os.environ.get('ARTIFACT_MAX_BYTES', str(2 * 1024 ** 3)))
+SWEEP_INTERVAL = int(os.environ.get('ARTIFACT_SWEEP_INTERVAL', '300'))  # seconds
+
+# <content hash>.<ext>, or <hash>-<encoding>.<ext> for a re-encoding of it
+NAME_RE = re.compile(r'^[0-9a-f]{32}(?:-[a-z0-9]+)?\.[a-z0-9]{2,4}$')
+
+
+def file_digest(path):
+    """SHA-256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArtifactStore:
+    """Finished files live under files/ named by content hash; scratch under work/."""
+
+    def __init__(self, root=ARTIFACT_DIR, ttl=ARTIFACT_TTL, max_bytes=ARTIFACT_MAX_BYTES):
+        self.root = os.path.abspath(root)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.files_dir = os.path.join(self.root, 'files')
+        self.work_dir = os.path.join(self.root, 'work')
+        os.makedirs(self.files_dir, exist_ok=True)
+        os.makedirs(self.work_dir, exist_ok=True)
+        self._sweeper_pid = None
+        self._sweeper_lock = threading.Lock()
+
+    @contextmanager
+    def workdir(self):
+        """A private scratch directory, removed when the block exits."""
+        path = os.path.join(self.work_dir, uuid.uuid4().hex)
+        os.makedirs(path)
+        try:
+            yield path
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def store(self, path, ext='mp3'):
+        """Move a finished file into the store and return its public name."""
+        name = f"{file_digest(path)[:32]}.{ext}"
+        target = os.path.join(self.files_dir, name)
+        if os.path.exists(target):
+            # Same content already stored; keep it fresh and drop the copy
+            os.utime(target)
+            os.remove(path)
+        else:
+            os.replace(path, target)
+        return name
+
+    def store_derived(self, path, name):
+        """Move a file made from a stored one (a re-encoding) in under `name`."""
+        os.replace(path, os.path.join(self.files_dir, name))
+        return name
+
+    def path(self, name):
+        """Filesystem path for a public name, or None if it isn't stored."""
+        if not NAME_RE.match(name):
+            return None
+        path = os.path.join(self.files_dir, name)
+        return path if os.path.isfile(path) else None
+
+    def sweep(self):
+        """Drop expired files and stale work dirs, then enforce the size cap."""
+        now = time.time()
+        for name in os.listdir(self.work_dir):
+            path = os.path.join(self.work_dir, name)
+            try:
+                if now - os.path.getmtime(path) > self.ttl:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                pass
+
+        files = []
+        for name in os.listdir(self.files_dir):
+            path = os.path.join(self.files_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if now - stat.st_mtime > self.ttl:
+                self._remove(path)
+            else:
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def start_sweeper(self, interval=SWEEP_INTERVAL, also=None):
+        """Run sweep() every `interval` seconds on a daemon thread.
+
+        `also`, if given, is called after each sweep, for state that should
+        expire with the files (job results pointing at them). Safe to call
+        repeatedly; a forked child (a preloaded gunicorn worker) starts its
+        own, since the parent's thread doesn't survive the fork.
+        """
+        with self._sweeper_lock:
+            if self._sweeper_pid == os.getpid():
+                return
+            self._sweeper_pid = os.getpid()
+
+        def loop():
+            while True:
+                try:
+                    self.sweep()
+                    if also:
+                        also()
+                except Exception:
+                    logger.exception('Artifact sweep failed')
+                time.sleep(interval)
+
+        threading.Thread(target=loop, name='artifact-sweeper', daemon=True).start()
+
+
+class ResultIndex:
+    """Maps an input fingerprint to a finished podcast in the artifact store.
+
+    Entries whose audio has since been swept from the store count as misses.
+    """
+
+    def __init__(self, store, directory, max_bytes):
+        self.store = store
+        self.disk = DiskCache(directory, max_bytes, suffix='.json')
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        data = self.disk.get(key)
+        result = json.loads(data) if data is not None else None
+        path = self.store.path(result['audio_file']) if result else None
+        with self._lock:
+            if path is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        # Being asked for again: keep it away from the TTL sweep
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return result
+
+    def put(self, key, result):
+        self.disk.put(key, json.dumps(result).encode('utf-8'))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': self.hits / lookups if lookups else 0.0}
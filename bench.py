@@ -0,0 +1,730 @@
+"""Benchmarks for the podcast pipeline.
+
+    python bench.py extract [--corpus DIR] [--repeat N]
+    python bench.py pipeline [--lengths ...] [--concurrency ...] [--output FILE]
+    python bench.py load [--concurrency ...] [--lengths ...] [--slots N] [--max-wait S]
+    python bench.py startup [--repeat N] [--budget-ms MS]
+    python bench.py gemini [--capacity N] [--error-rate R] [--outage START SECONDS]
+
+`extract` compares extract.extract_article with the BeautifulSoup extractor
+it replaced, on every *.html file in DIR (saved pages). Without --corpus it
+runs on generated news-style pages.
+
+`pipeline` drives run_pipeline end to end with local stand-ins for Gemini,
+gTTS and the article site (a local HTTP server), each with configurable
+latency. It reports per-stage p50/p95/p99, throughput and peak RSS for every
+length x concurrency combination and writes them as JSON; pass --compare
+with an earlier results file to see the change.
+
+`load` starts the app with the same stubs under gunicorn with a single
+threaded worker and fires concurrent form POSTs at it, of random lengths
+from --lengths. It reports request throughput, the latency of served
+requests per length, how many were turned away by admission control (503
+with Retry-After) and how fast, and the peak number of pipelines in flight
+on that worker's async core. --slots, --queue and --max-wait set the
+ADMISSION_* limits; a large --slots effectively turns admission off.
+
+`startup` imports the app in fresh interpreters under `-X importtime`,
+reports the median import and first-response times and the slowest direct
+imports, and exits non-zero if the import exceeds --budget-ms or pulls in a
+library that should only load on first use (the Gemini SDK, gTTS, requests).
+
+`gemini` sends the same burst of calls to a fake model that injects
+latency, 5xx errors, a 429 quota and an optional outage, first directly
+and then through gemini.GeminiClient, and compares what callers see.
+"""
+import argparse
+import contextvars
+import glob
+import inspect
+import json
+import multiprocessing
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from extract import extract_article
+
+SCRIPT_INPUT_CHARS = 4000
+
+
+def legacy_extract(html):
+    """The original html.parser + decompose() extractor, kept for comparison."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+    for tag in soup(['script', 'style', 'nav', 'header', 'footer', 'aside',
+                     'form', 'button', 'iframe', 'noscript']):
+        tag.decompose()
+    article = soup.find('article') or soup.find('main') or soup.find('body')
+    if article:
+        return ' '.join(article.get_text(separator=' ', strip=True).split())
+    return None
+
+
+def generate_page(rng, paragraphs=60, sidebar_links=300):
+    """A heavy news-style page: big head, scripts, nav, long article, footer."""
+    words = ('the market council report said new data shows that people over '
+             'last year city plan could would because research team found').split()
+
+    def sentence():
+        return ' '.join(rng.choice(words) for _ in range(rng.randint(8, 20))).capitalize() + '.'
+
+    parts = ['<!DOCTYPE html><html><head><title>News</title>']
+    parts += ['<script>var data = %s;</script>' % ('[' + ','.join(['1'] * 2000) + ']')] * 5
+    parts += ['<style>.a{color:red}</style>' * 200, '</head><body>']
+    parts.append('<header><nav>' + ''.join(
+        f'<a href="/s/{i}">Section {i}</a>' for i in range(80)) + '</nav></header>')
+    parts.append('<div class="layout"><aside>' + ''.join(
+        f'<li><a href="/r/{i}">Related story {i}</a></li>' for i in range(sidebar_links)) + '</aside>')
+    parts.append('<article><h1>Headline</h1>')
+    for _ in range(paragraphs):
+        parts.append('<p>' + ' '.join(sentence() for _ in range(4)) +
+                     ' <a href="/x">more</a></p><div class="ad"><iframe src="/ad"></iframe></div>')
+    parts.append('</article></div><footer>' + '<p>Legal text.</p>' * 50 + '</footer></body></html>')
+    return ''.join(parts)
+
+
+def load_corpus(directory):
+    if directory:
+        pages = []
+        for path in sorted(glob.glob(os.path.join(directory, '*.html'))):
+            with open(path, encoding='utf-8', errors='replace') as f:
+                pages.append((os.path.basename(path), f.read()))
+        return pages
+    rng = random.Random(42)
+    return [(f'generated-{i}', generate_page(rng, paragraphs=20 + 20 * i))
+            for i in range(5)]
+
+
+def measure(fn, html, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(html)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    result = fn(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(times), peak, result
+
+
+def bench_extract(args):
+    pages = load_corpus(args.corpus)
+    if not pages:
+        raise SystemExit(f'No *.html files in {args.corpus}')
+
+    extractors = [
+        ('legacy', legacy_extract),
+        ('streaming', lambda html: extract_article(html, limit=SCRIPT_INPUT_CHARS)),
+    ]
+    print(f"{'page':<24}{'KB':>8}  " + ''.join(
+        f'{name + " ms":>14}{name + " KB peak":>18}  ' for name, _ in extractors) + f"{'prefix match':>12}")
+    totals = {name: 0.0 for name, _ in extractors}
+    for name, html in pages:
+        row = f'{name[:23]:<24}{len(html) / 1024:>8.0f}  '
+        texts = {}
+        for label, fn in extractors:
+            seconds, peak, text = measure(fn, html, args.repeat)
+            totals[label] += seconds
+            texts[label] = text or ''
+            row += f'{seconds * 1000:>14.1f}{peak / 1024:>18.0f}  '
+        # How much of what the prompt would see is the same under both
+        a = texts['legacy'][:SCRIPT_INPUT_CHARS]
+        b = texts['streaming'][:SCRIPT_INPUT_CHARS]
+        same = sum(1 for x, y in zip(a.split(), b.split()) if x == y)
+        row += f'{same / max(1, len(a.split())):>12.0%}'
+        print(row)
+    speedup = totals['legacy'] / totals['streaming'] if totals['streaming'] else float('inf')
+    print(f'total legacy {totals["legacy"] * 1000:.1f} ms, streaming '
+          f'{totals["streaming"] * 1000:.1f} ms ({speedup:.1f}x)')
+
+
+STAGES = ('fetch', 'script', 'tts', 'combine', 'total')
+SCRIPT_TURNS = {'short': 12, 'medium': 28, 'long': 48}
+PROMPT_WORDS = {'short': 150, 'medium': 350, 'long': 600}  # as in build_script_prompt
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb():
+    # ru_maxrss is KB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubModel:
+    """Stands in for the Gemini model: sleeps, then returns a script.
+
+    With `capacity`, calls beyond that many at once wait for a free one,
+    like a saturated backend.
+    """
+
+    def __init__(self, latency, capacity=None):
+        self.latency = latency
+        self.capacity = threading.Semaphore(capacity) if capacity else None
+
+    def generate_content(self, prompt, stream=False, generation_config=None,
+                         request_options=None):
+        if self.capacity:
+            with self.capacity:
+                time.sleep(self.latency)
+        else:
+            time.sleep(self.latency)
+        turns = SCRIPT_TURNS['medium']
+        for length, words in PROMPT_WORDS.items():
+            if f'Around {words} words' in prompt:
+                turns = SCRIPT_TURNS[length]
+        # Vary the wording per prompt so runs don't collapse into cache hits
+        seed = hash(prompt)
+        script = json.dumps({'turns': [
+            {'host': 'Alex' if i % 2 == 0 else 'Sam',
+             'text': f"Line {i} of take {seed}, and honestly it's kind of wild, right?"}
+            for i in range(turns)]})
+        if stream:
+            return [StubResponse(script[i:i + 64]) for i in range(0, len(script), 64)]
+        return StubResponse(script)
+
+
+class FakeAPIError(Exception):
+    """Carries an HTTP status as `code`, like the SDK's API errors."""
+
+    def __init__(self, code):
+        super().__init__(f'HTTP {code}')
+        self.code = code
+
+
+class FlakyModel:
+    """Fake Gemini that injects latency, errors, a quota and an outage.
+
+    Latency is exponential around `latency`; calls past the attempt's
+    timeout get a 504. More than `capacity` concurrent calls get a 429, and
+    every call during the outage window (seconds after start) gets a 503.
+    """
+
+    def __init__(self, latency, error_rate, capacity, outage=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.capacity = capacity
+        self.outage = outage
+        self.started = time.monotonic()
+        self.active = 0
+        self.peak = 0
+        self.codes = {}
+        self._lock = threading.Lock()
+
+    def _fail(self, code, delay):
+        with self._lock:
+            self.codes[code] = self.codes.get(code, 0) + 1
+        time.sleep(delay)
+        raise FakeAPIError(code)
+
+    def generate_content(self, prompt, stream=False, request_options=None, **kwargs):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            active = self.active
+        try:
+            elapsed = time.monotonic() - self.started
+            if self.outage and self.outage[0] <= elapsed < self.outage[0] + self.outage[1]:
+                self._fail(503, 0.01)
+            if active > self.capacity:
+                self._fail(429, 0.01)
+            delay = random.expovariate(1 / self.latency)
+            timeout = (request_options or {}).get('timeout')
+            if timeout and delay > timeout:
+                self._fail(504, timeout)
+            time.sleep(delay)
+            if random.random() < self.error_rate:
+                self._fail(random.choice((500, 503)), 0)
+            return StubResponse('ok')
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def stub_tts(latency):
+    """A TTS backend returning ~24ms MP3 frames per character group, after a delay."""
+    frame = b'\xff\xf3\x44\xc0' + b'\x00' * 92
+
+    def backend(text, lang, host):
+        time.sleep(latency)
+        return frame * max(1, len(text) // 3)
+
+    return backend
+
+
+def start_page_server(latency, rng):
+    """Serve generated article pages locally after `latency` seconds.
+
+    The request path goes into the article so every URL has its own text.
+    """
+    head, _, tail = generate_page(rng).partition('<h1>Headline</h1>')
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            time.sleep(latency)
+            page = f'{head}<h1>Story {self.path}</h1>{tail}'.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(page)))
+            self.end_headers()
+            self.wfile.write(page)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def instrument(fn, stage, timings):
+    """Wrap a stage so each call appends (stage, seconds) to the job's timings."""
+    if inspect.iscoroutinefunction(fn):
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                timings.get().append((stage, time.perf_counter() - start))
+    else:
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                timings.get().append((stage, time.perf_counter() - start))
+    return wrapper
+
+
+def stubbed_app(args):
+    """Import the app with caches in a temp dir and every backend stubbed."""
+    # Keep every cache and artifact of the run out of the working tree
+    workdir = tempfile.mkdtemp(prefix='huxe-bench-')
+    for var, name in (('TTS_CACHE_DIR', 'tts'), ('SCRIPT_CACHE_DIR', 'scripts'),
+                      ('CHUNK_CACHE_DIR', 'chunks'), ('RESULT_INDEX_DIR', 'results'),
+                      ('FETCH_CACHE_DIR', 'pages'), ('ARTIFACT_DIR', 'artifacts'),
+                      ('METRICS_DIR', 'metrics')):
+        os.environ[var] = os.path.join(workdir, name)
+    os.environ['JOBS_DB'] = os.path.join(workdir, 'jobs.db')
+    os.environ.setdefault('GEMINI_API_KEY', 'stub')
+
+    import app
+    import tts
+
+    tts.default_backend = stub_tts(args.tts_latency)
+    app.model = StubModel(args.gemini_latency, getattr(args, 'gemini_capacity', None))
+    return app
+
+
+def bench_pipeline(args):
+    app = stubbed_app(args)
+    server = start_page_server(args.fetch_latency, random.Random(7))
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    # run_pipeline looks the stages up on the module, so wrap them there.
+    # The list is shared by reference with the tasks and threads a job
+    # fans out to, since they all start from a copy of its context.
+    job_timings = contextvars.ContextVar('job_timings')
+    for attr, stage in (('extract_text_from_url', 'fetch'), ('create_podcast_script', 'script'),
+                        ('generate_audio', 'tts'), ('combine_audio_files', 'combine')):
+        setattr(app, attr, instrument(getattr(app, attr), stage, job_timings))
+
+    nonce = time.time_ns()
+    results = []
+    for length in args.lengths:
+        for concurrency in args.concurrency:
+            samples = []
+            samples_lock = threading.Lock()
+
+            def one(i):
+                timings = []
+                job_timings.set(timings)
+                start = time.perf_counter()
+                if args.source == 'url':
+                    app.run_pipeline('', length, url=f'{base_url}/{nonce}/{length}/{concurrency}/{i}')
+                else:
+                    app.run_pipeline(f'Document {nonce}-{length}-{concurrency}-{i}. ' * 20, length)
+                timings.append(('total', time.perf_counter() - start))
+                with samples_lock:
+                    samples.extend(timings)
+
+            jobs = args.jobs or concurrency * 4
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(one, range(jobs)))
+            elapsed = time.perf_counter() - start
+
+            stages = {}
+            for stage in STAGES:
+                values = [seconds for name, seconds in samples if name == stage]
+                if values:
+                    stages[stage] = {f'p{p}': round(percentile(values, p) * 1000, 2)
+                                     for p in (50, 95, 99)}
+            results.append({
+                'length': length,
+                'concurrency': concurrency,
+                'jobs': jobs,
+                'throughput_per_s': round(jobs / elapsed, 3),
+                'peak_rss_mb': round(peak_rss_mb(), 1),
+                'stages_ms': stages,
+            })
+            print(f'{length:<7} c={concurrency:<3} {jobs / elapsed:7.2f} jobs/s  ' + '  '.join(
+                f"{stage} p50/p95/p99 {v['p50']:.0f}/{v['p95']:.0f}/{v['p99']:.0f}ms"
+                for stage, v in stages.items()))
+
+    server.shutdown()
+    report = {
+        'created_at': time.time(),
+        'config': {key: value for key, value in vars(args).items()
+                   if key not in ('run', 'command', 'compare', 'output')},
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'wrote {args.output}')
+    if args.compare:
+        compare_reports(args.compare, report)
+
+
+def compare_reports(path, report):
+    """Print p50 and throughput changes against an earlier results file."""
+    with open(path) as f:
+        previous = {(r['length'], r['concurrency']): r for r in json.load(f)['results']}
+    for result in report['results']:
+        old = previous.get((result['length'], result['concurrency']))
+        if not old:
+            continue
+        changes = [f"throughput {change(old['throughput_per_s'], result['throughput_per_s'])}"]
+        for stage, values in result['stages_ms'].items():
+            if stage in old['stages_ms']:
+                changes.append(f"{stage} p50 {change(old['stages_ms'][stage]['p50'], values['p50'])}")
+        print(f"{result['length']:<7} c={result['concurrency']:<3} " + '  '.join(changes))
+
+
+def change(old, new):
+    if not old:
+        return 'n/a'
+    return f'{(new - old) / old:+.1%}'
+
+
+def bench_gemini(args):
+    import gemini
+
+    def run(label, call, model):
+        outcomes = []  # (seconds, 'ok' | 'rejected' | 'error')
+
+        def one(i):
+            start = time.perf_counter()
+            try:
+                call(f'prompt {i}')
+                outcome = 'ok'
+            except gemini.Unavailable as e:
+                # Chained ones were attempted and ran out of retries
+                outcome = 'error' if e.__cause__ else 'rejected'
+            except Exception:
+                outcome = 'error'
+            outcomes.append((time.perf_counter() - start, outcome))
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(one, range(args.calls)))
+        elapsed = time.perf_counter() - start
+        ok = [seconds for seconds, outcome in outcomes if outcome == 'ok']
+        counts = {name: sum(1 for _, outcome in outcomes if outcome == name)
+                  for name in ('ok', 'rejected', 'error')}
+        codes = ' '.join(f'{code}:{n}' for code, n in sorted(model.codes.items()))
+        print(f'{label:<7} {elapsed:6.1f}s  ok {counts["ok"]:<4} rejected {counts["rejected"]:<4} '
+              f'error {counts["error"]:<4} ok p50/p95 {percentile(ok, 50):.2f}/'
+              f'{percentile(ok, 95):.2f}s  model peak {model.peak:<3} answers {codes}')
+
+    def fake():
+        return FlakyModel(args.latency, args.error_rate, args.capacity, args.outage)
+
+    direct = fake()
+    run('direct', lambda prompt: direct.generate_content(prompt), direct)
+
+    wrapped = fake()
+    client = gemini.GeminiClient(
+        lambda: wrapped, timeout=args.latency * 5, deadline=args.deadline, backoff=0.05,
+        limit=gemini.AdaptiveLimit(initial=4, maximum=args.concurrency, decrease_interval=0.2),
+        breaker=gemini.CircuitBreaker(threshold=5, cooldown=0.5))
+    run('client', client.generate_content, wrapped)
+    print(f'client stats {client.stats()}')
+
+
+def serve_stubbed(args, port):
+    """Run the stubbed app under gunicorn: one gthread worker, like production."""
+    from gunicorn.app.base import BaseApplication
+
+    for var, value in (('ADMISSION_SLOTS', args.slots), ('ADMISSION_QUEUE', args.queue),
+                       ('ADMISSION_MAX_WAIT', args.max_wait)):
+        if value is not None:
+            os.environ[var] = str(value)
+
+    class StubbedGunicorn(BaseApplication):
+        def load_config(self):
+            for key, value in (('bind', f'127.0.0.1:{port}'), ('workers', 1),
+                               ('worker_class', 'gthread'), ('threads', args.threads),
+                               ('loglevel', 'warning'), ('timeout', 120)):
+                self.cfg.set(key, value)
+
+        def load(self):
+            # Runs in the worker, after the fork
+            return stubbed_app(args).app
+
+    StubbedGunicorn().run()
+
+
+def in_flight(base_url):
+    """Pipelines currently running on the server's async cores, from /metrics."""
+    return sum(int(float(line.split()[-1]))
+               for line in requests.get(f'{base_url}/metrics', timeout=5).text.splitlines()
+               if line.startswith('huxe_async_core{stat="in_flight",'))
+
+
+def bench_load(args):
+    import socket
+
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    base_url = f'http://127.0.0.1:{port}'
+    server = multiprocessing.get_context('fork').Process(target=serve_stubbed, args=(args, port))
+    server.start()
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                requests.get(f'{base_url}/metrics', timeout=1)
+                break
+            except requests.ConnectionError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.2)
+
+        nonce = time.time_ns()
+        rng = random.Random(11)
+        for concurrency in args.concurrency:
+            outcomes = []  # (seconds, length, 'ok' | 'busy' | 'failed')
+            peak = [0]
+            done = threading.Event()
+
+            def watch():
+                while not done.wait(0.2):
+                    peak[0] = max(peak[0], in_flight(base_url))
+
+            def one(i, length):
+                text = f'Load test document {nonce}-{concurrency}-{i}. ' * 20
+                start = time.perf_counter()
+                response = requests.post(base_url + '/', data={
+                    'input_type': 'text', 'text': text, 'length': length}, timeout=600)
+                if response.status_code == 200 and '/audio/' in response.text:
+                    status = 'ok'
+                elif response.status_code == 503 and response.headers.get('Retry-After'):
+                    status = 'busy'
+                else:
+                    status = 'failed'
+                outcomes.append((time.perf_counter() - start, length, status))
+
+            watcher = threading.Thread(target=watch, daemon=True)
+            watcher.start()
+            requests_total = args.requests or concurrency * 2
+            lengths = [rng.choice(args.lengths) for _ in range(requests_total)]
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(one, range(requests_total), lengths))
+            elapsed = time.perf_counter() - start
+            done.set()
+            watcher.join()
+
+            def latencies(status, length=None):
+                return [seconds for seconds, kind, outcome in outcomes
+                        if outcome == status and length in (None, kind)]
+
+            served = latencies('ok')
+            busy = latencies('busy')
+            print(f'c={concurrency:<4} {len(served) / elapsed:7.2f} served/s  '
+                  f'served {len(served):<4} p50/p95 {percentile(served, 50):.2f}/'
+                  f'{percentile(served, 95):.2f}s  busy {len(busy):<4} p95 '
+                  f'{percentile(busy, 95):.2f}s  failed {len(latencies("failed")):<4} '
+                  f'peak in flight {peak[0]}')
+            if len(args.lengths) > 1:
+                for length in args.lengths:
+                    times = latencies('ok', length)
+                    print(f'       {length:<7} served {len(times):<4} p50/p95 '
+                          f'{percentile(times, 50):.2f}/{percentile(times, 95):.2f}s  '
+                          f'busy {len(latencies("busy", length))}')
+    finally:
+        server.terminate()
+        server.join(30)
+
+
+# Run in a fresh interpreter per sample: app import, then the first request
+STARTUP_SNIPPET = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.app.test_client().get('/')
+print(json.dumps({'import': imported - start, 'first_response': time.perf_counter() - imported}))
+"""
+# Libraries that must stay out of startup; they are imported on first use
+STARTUP_FORBIDDEN = ('google.generativeai', 'gtts', 'requests', 'bs4')
+
+
+def import_tree(stderr, root):
+    """Modules imported while importing `root`, from `python -X importtime` output.
+
+    Returns [(name, self us, cumulative us, depth)] with depth 0 for `root`
+    itself. importtime lists children before their parent, so the subtree
+    is everything between the previous top-level line and `root`'s.
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        try:
+            own, cumulative, name = line[len('import time:'):].split('|')
+            own, cumulative = int(own), int(cumulative)
+        except ValueError:
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((name.strip(), own, cumulative, depth))
+    tree = []
+    for entry in entries:
+        if entry[3] == 0:
+            if entry[0] == root:
+                return tree + [entry]
+            tree = []
+        else:
+            tree.append(entry)
+    return []
+
+
+def bench_startup(args):
+    workdir = tempfile.mkdtemp(prefix='huxe-bench-')
+    env = dict(os.environ, GEMINI_API_KEY='stub', JOB_WORKERS='0', LOG_LEVEL='WARNING',
+               JOBS_DB=os.path.join(workdir, 'jobs.db'),
+               ARTIFACT_DIR=os.path.join(workdir, 'artifacts'))
+    for var, name in (('TTS_CACHE_DIR', 'tts'), ('SCRIPT_CACHE_DIR', 'scripts'),
+                      ('CHUNK_CACHE_DIR', 'chunks'), ('RESULT_INDEX_DIR', 'results'),
+                      ('FETCH_CACHE_DIR', 'pages'), ('METRICS_DIR', 'metrics')):
+        env[var] = os.path.join(workdir, name)
+
+    samples = []
+    tree = []
+    for _ in range(args.repeat):
+        run = subprocess.run([sys.executable, '-X', 'importtime', '-c', STARTUP_SNIPPET],
+                             cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                             capture_output=True, text=True, check=True)
+        samples.append(json.loads(run.stdout.strip().splitlines()[-1]))
+        tree = import_tree(run.stderr, 'app')
+
+    import_ms = statistics.median(s['import'] for s in samples) * 1000
+    first_ms = statistics.median(s['first_response'] for s in samples) * 1000
+    print(f'import app {import_ms:.0f} ms, first response {first_ms:.0f} ms '
+          f'(median of {args.repeat})')
+    print('slowest imports pulled in directly by app:')
+    direct = [(cumulative, name) for name, _, cumulative, depth in tree if depth == 1]
+    for cumulative, name in sorted(direct, reverse=True)[:args.top]:
+        print(f'  {cumulative / 1000:8.1f} ms  {name}')
+
+    loaded = {name for name, _, _, _ in tree}
+    failures = [f'{name} is imported at startup' for name in STARTUP_FORBIDDEN
+                if name in loaded]
+    if args.budget_ms and import_ms > args.budget_ms:
+        failures.append(f'import took {import_ms:.0f} ms, budget is {args.budget_ms} ms')
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    if failures:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    extract = commands.add_parser('extract', help='article extraction speed and memory')
+    extract.add_argument('--corpus', help='directory of saved *.html pages')
+    extract.add_argument('--repeat', type=int, default=5)
+    extract.set_defaults(run=bench_extract)
+
+    pipeline = commands.add_parser('pipeline', help='end-to-end latency with stub backends')
+    pipeline.add_argument('--lengths', nargs='+', default=['short', 'medium', 'long'],
+                          choices=list(SCRIPT_TURNS))
+    pipeline.add_argument('--concurrency', nargs='+', type=int, default=[1, 4, 16])
+    pipeline.add_argument('--jobs', type=int, help='jobs per run (default 4x concurrency)')
+    pipeline.add_argument('--source', choices=['text', 'url'], default='url')
+    pipeline.add_argument('--gemini-latency', type=float, default=2.0, help='seconds')
+    pipeline.add_argument('--tts-latency', type=float, default=0.3, help='seconds per line')
+    pipeline.add_argument('--fetch-latency', type=float, default=0.2, help='seconds')
+    pipeline.add_argument('--output', default='bench_results.json')
+    pipeline.add_argument('--compare', help='earlier results file to diff against')
+    pipeline.set_defaults(run=bench_pipeline)
+
+    load = commands.add_parser('load', help='concurrent requests against one stubbed worker')
+    load.add_argument('--concurrency', nargs='+', type=int, default=[1, 16, 64])
+    load.add_argument('--requests', type=int, help='requests per level (default 2x concurrency)')
+    load.add_argument('--threads', type=int, default=64, help='gunicorn threads')
+    load.add_argument('--lengths', nargs='+', choices=list(SCRIPT_TURNS), default=['medium'],
+                      help='each request picks one at random')
+    load.add_argument('--gemini-capacity', type=int,
+                      help='concurrent Gemini calls the stub serves before they queue')
+    load.add_argument('--slots', type=int, help='ADMISSION_SLOTS')
+    load.add_argument('--queue', type=int, help='ADMISSION_QUEUE')
+    load.add_argument('--max-wait', type=float, help='ADMISSION_MAX_WAIT, seconds')
+    load.add_argument('--gemini-latency', type=float, default=2.0, help='seconds')
+    load.add_argument('--tts-latency', type=float, default=0.3, help='seconds per line')
+    load.set_defaults(run=bench_load)
+
+    fake = commands.add_parser('gemini', help='Gemini client layer against a flaky fake model')
+    fake.add_argument('--calls', type=int, default=400)
+    fake.add_argument('--concurrency', type=int, default=64, help='calling threads')
+    fake.add_argument('--latency', type=float, default=0.2, help='mean seconds per call')
+    fake.add_argument('--error-rate', type=float, default=0.05, help='share of 500/503 answers')
+    fake.add_argument('--capacity', type=int, default=16,
+                      help='concurrent calls before the fake answers 429')
+    fake.add_argument('--outage', type=float, nargs=2, metavar=('START', 'SECONDS'),
+                      help='answer 503 to everything for a while')
+    fake.add_argument('--deadline', type=float, default=10, help='seconds per client call')
+    fake.set_defaults(run=bench_gemini)
+
+    startup = commands.add_parser('startup', help='import time of the app and its first response')
+    startup.add_argument('--repeat', type=int, default=5)
+    startup.add_argument('--top', type=int, default=10, help='slowest direct imports to list')
+    startup.add_argument('--budget-ms', type=float, default=500,
+                         help='fail if importing app takes longer (0 disables)')
+    startup.set_defaults(run=bench_startup)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == '__main__':
+    main()
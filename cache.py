@@ -0,0 +1,276 @@
+"""Small caching helpers shared by the pipeline stages."""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+RESCAN_INTERVAL = 10  # seconds between directory scans that pick up other processes' entries
+
+
+def make_key(*parts):
+    """Hash the given parts into a stable hex cache key."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """Persistent key -> bytes cache with size-bounded LRU eviction.
+
+    Entries are plain files named by key, and several processes may share
+    a directory. A lookup always checks the file, so entries written by
+    other processes are hits too. Recency is tracked in memory and seeded
+    from file mtimes (which hits refresh). A write re-scans the directory
+    if the last scan is over RESCAN_INTERVAL seconds old or the cache looks
+    over `max_bytes`. Eviction therefore goes by what is on disk, not by what
+    this process wrote. Between scans the other processes' writes can push
+    the total past the cap.
+    """
+
+    def __init__(self, directory, max_bytes, suffix=''):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> size, oldest first
+        self._size = 0
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._scanned = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if not self._loaded:
+                self._scan()
+                self._evict()
+                self._loaded = True
+
+    def _scan(self):
+        # Caller holds the lock
+        self._entries.clear()
+        self._size = 0
+        self._scanned = time.monotonic()
+        found = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.suffix) or name.startswith('.'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            key = name[:len(name) - len(self.suffix)] if self.suffix else name
+            found.append((stat.st_mtime, key, stat.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._size += size
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, key):
+        """Return the cached bytes for `key`, or None on a miss."""
+        self._ensure_loaded()
+        try:
+            with open(self.path(key), 'rb') as f:
+                data = f.read()
+        except OSError:
+            # Not written yet, or evicted (perhaps by another process)
+            self._forget(key)
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            else:
+                self._entries[key] = len(data)
+                self._size += len(data)
+        try:
+            os.utime(self.path(key))
+        except OSError:
+            pass
+        return data
+
+    def put(self, key, data):
+        """Store `data` under `key`, evicting least recently used entries."""
+        if len(data) > self.max_bytes:
+            return
+        self._ensure_loaded()
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, self.path(key))
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        with self._lock:
+            self._size -= self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._size += len(data)
+            if (self._size > self.max_bytes
+                    or time.monotonic() - self._scanned > RESCAN_INTERVAL):
+                self._scan()
+            self._evict()
+
+    def _forget(self, key):
+        with self._lock:
+            self._size -= self._entries.pop(key, 0)
+
+    def _evict(self):
+        # Caller holds the lock
+        while self._size > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
+
+    def stats(self):
+        self._ensure_loaded()
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'entries': len(self._entries), 'bytes': self._size}
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU mapping with a fixed number of entries."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapse concurrent calls for the same key into one execution."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Run fn() once per key at a time; callers arriving meanwhile share its result."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = fn()
+            return call.value
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class TieredCache:
+    """Text cache with an in-memory LRU in front of a DiskCache.
+
+    get_or_create() runs the expensive call at most once per key at a time.
+    """
+
+    def __init__(self, max_entries, disk=None):
+        self.memory = LRUCache(max_entries)
+        self.disk = disk
+        self.flights = SingleFlight()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _lookup(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            return value, 'memory_hits'
+        if self.disk is not None:
+            data = self.disk.get(key)
+            if data is not None:
+                value = data.decode('utf-8')
+                self.memory.put(key, value)
+                return value, 'disk_hits'
+        return None, None
+
+    def get(self, key):
+        """Return the cached value or None, counting the lookup."""
+        value, tier = self._lookup(key)
+        self._count(tier or 'misses')
+        return value
+
+    def put(self, key, value):
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value.encode('utf-8'))
+
+    def get_or_create(self, key, create):
+        """Return the cached value for key, calling create() on a miss."""
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        def fill():
+            # Another flight may have filled it while we were queued up
+            value, _ = self._lookup(key)
+            if value is None:
+                value = create()
+                self.put(key, value)
+            return value
+
+        return self.flights.do(key, fill)
+
+    def stats(self):
+        with self._lock:
+            return {'memory_hits': self.memory_hits, 'disk_hits': self.disk_hits,
+                    'misses': self.misses, 'entries': len(self.memory)}
@@ -0,0 +1,170 @@
+"""Streaming article extraction.
+
+Parses HTML with the stdlib event parser instead of building a full tree:
+boilerplate subtrees (scripts, nav, footers, forms...) are skipped as they
+stream past, text is attributed to its nearest block container, and the
+container with the most non-link text wins. When a `limit` is given and an
+<article>/<main> element has already produced that much text, parsing
+stops early.
+"""
+from html.parser import HTMLParser
+
+SKIP_TAGS = {'script', 'style', 'nav', 'header', 'footer', 'aside', 'form',
+             'button', 'iframe', 'noscript', 'svg', 'template', 'select'}
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+             'link', 'meta', 'param', 'source', 'track', 'wbr'}
+INLINE_TAGS = {'a', 'abbr', 'b', 'bdi', 'bdo', 'cite', 'code', 'data', 'dfn',
+               'em', 'font', 'i', 'kbd', 'label', 'mark', 'q', 's', 'samp',
+               'small', 'span', 'strong', 'sub', 'sup', 'time', 'u', 'var'}
+SELF_CLOSING = {'p', 'li', 'td', 'th', 'tr', 'dt', 'dd', 'option'}
+CONTENT_TAGS = {'article', 'main'}
+CONTENT_BONUS = 1.25
+FEED_SIZE = 16 * 1024
+
+
+class _StopParsing(Exception):
+    pass
+
+
+class ArticleParser(HTMLParser):
+    """Collects (container, text, is_link) chunks while skipping boilerplate."""
+
+    def __init__(self, limit=None):
+        super().__init__(convert_charrefs=True)
+        self.limit = limit
+        self.tags = []  # tag name per element id
+        self.parents = []  # parent element id per element id
+        self.stack = []  # open elements as (tag, element id)
+        self.skip_depth = 0
+        self.link_depth = 0
+        self.chunks = []  # (block element id, text, in_link)
+        self.content_chars = {}  # open article/main id -> text chars seen
+        self.early_winner = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.skip_depth:
+            if tag in SKIP_TAGS:
+                self.skip_depth += 1
+            return
+        if tag in SKIP_TAGS:
+            self.skip_depth = 1
+            return
+        if tag in VOID_TAGS:
+            return
+        if tag in SELF_CLOSING and self.stack and self.stack[-1][0] == tag:
+            self.handle_endtag(tag)
+
+        element = len(self.tags)
+        self.tags.append(tag)
+        self.parents.append(self.stack[-1][1] if self.stack else None)
+        self.stack.append((tag, element))
+        if tag == 'a':
+            self.link_depth += 1
+        if tag in CONTENT_TAGS:
+            self.content_chars[element] = 0
+
+    def handle_startendtag(self, tag, attrs):
+        # <br/>, <img/> and friends never hold text
+        pass
+
+    def handle_endtag(self, tag):
+        if self.skip_depth:
+            if tag in SKIP_TAGS:
+                self.skip_depth -= 1
+            return
+        for i in range(len(self.stack) - 1, -1, -1):
+            if self.stack[i][0] == tag:
+                for closed, element in self.stack[i:]:
+                    if closed == 'a':
+                        self.link_depth -= 1
+                    self.content_chars.pop(element, None)
+                del self.stack[i:]
+                return
+
+    def handle_data(self, data):
+        if self.skip_depth or not data.strip():
+            return
+        block = None
+        for tag, element in reversed(self.stack):
+            if tag not in INLINE_TAGS:
+                block = element
+                break
+        self.chunks.append((block, data, self.link_depth > 0))
+
+        if self.limit and not self.link_depth:
+            for element in self.content_chars:
+                self.content_chars[element] += len(data)
+                if self.content_chars[element] >= self.limit:
+                    self.early_winner = element
+                    raise _StopParsing()
+
+    def best_container(self):
+        """Element id with the highest text-density score."""
+        if self.early_winner is not None:
+            return self.early_winner
+
+        text = {}
+        links = {}
+        for block, data, in_link in self.chunks:
+            size = len(data.strip())
+            # Like Readability: a block's text credits its parent in full
+            # and its grandparent at half weight
+            element = self.parents[block] if block is not None else None
+            for weight in (1.0, 0.5):
+                if element is None:
+                    break
+                text[element] = text.get(element, 0) + size * weight
+                if in_link:
+                    links[element] = links.get(element, 0) + size * weight
+                element = self.parents[element]
+
+        best, best_score = None, 0.0
+        for element, total in text.items():
+            score = (total - links.get(element, 0)) * (1 - links.get(element, 0) / total)
+            if self.tags[element] in CONTENT_TAGS:
+                score *= CONTENT_BONUS
+            if score > best_score:
+                best, best_score = element, score
+        return best
+
+    def is_inside(self, element, container, memo):
+        """Whether `element` is `container` or one of its descendants."""
+        path = []
+        found = False
+        while element is not None:
+            if element == container:
+                found = True
+                break
+            if element in memo:
+                found = memo[element]
+                break
+            path.append(element)
+            element = self.parents[element]
+        for visited in path:
+            memo[visited] = found
+        return found
+
+
+def extract_article(html, limit=None):
+    """Return the main text of an HTML page, or None if there isn't any.
+
+    With `limit`, parsing may stop once that many characters of article
+    text are available; the result is then at least about `limit` long.
+    """
+    parser = ArticleParser(limit)
+    try:
+        for start in range(0, len(html), FEED_SIZE):
+            parser.feed(html[start:start + FEED_SIZE])
+        parser.close()
+    except _StopParsing:
+        pass
+
+    container = parser.best_container()
+    if container is None:
+        return None
+
+    memo = {}
+    parts = [data for block, data, _ in parser.chunks
+             if block is not None and parser.is_inside(block, container, memo)]
+    text = ' '.join(' '.join(parts).split())
+    return text or None
@@ -0,0 +1,139 @@
+"""Page fetching with pooled connections, an HTTP cache and size limits."""
+import json
+import os
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+from cache import DiskCache, make_key
+from metrics import bytes_total
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+TIMEOUT = 10  # seconds
+MAX_BODY_BYTES = int(os.environ.get('FETCH_MAX_BODY_BYTES', str(5 * 1024 * 1024)))
+PER_DOMAIN_LIMIT = int(os.environ.get('FETCH_PER_DOMAIN_LIMIT', '4'))
+POOL_SIZE = int(os.environ.get('FETCH_POOL_SIZE', '32'))
+CACHE_DIR = os.environ.get('FETCH_CACHE_DIR', os.path.join('.cache', 'pages'))
+CACHE_MAX_BYTES = int(os.environ.get('FETCH_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+CHUNK_SIZE = 64 * 1024
+
+MAX_AGE_RE = re.compile(r'max-age=(\d+)')
+
+
+def make_session():
+    """A keep-alive session shared by every fetch in this process."""
+    # requests is imported here rather than at the top: it is a large share
+    # of the app's import time and only URL input needs it
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = USER_AGENT
+    return session
+
+
+_session = None
+_session_lock = threading.Lock()
+page_cache = DiskCache(CACHE_DIR, CACHE_MAX_BYTES, suffix='.page')
+
+_domain_slots = {}
+_domain_lock = threading.Lock()
+
+
+def get_session():
+    """The process's session, created on the first fetch."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = make_session()
+        return _session
+
+
+def domain_slot(url):
+    """Semaphore capping concurrent requests to one host."""
+    host = urlsplit(url).hostname or ''
+    with _domain_lock:
+        slot = _domain_slots.get(host)
+        if slot is None:
+            slot = _domain_slots[host] = threading.BoundedSemaphore(PER_DOMAIN_LIMIT)
+        return slot
+
+
+def _load(key):
+    data = page_cache.get(key)
+    if data is None:
+        return None, None
+    meta, _, body = data.partition(b'\n')
+    return json.loads(meta), body
+
+
+def _save(key, meta, body):
+    page_cache.put(key, json.dumps(meta).encode('utf-8') + b'\n' + body)
+
+
+def _max_age(response):
+    cache_control = response.headers.get('Cache-Control', '')
+    if 'no-store' in cache_control or 'no-cache' in cache_control:
+        return 0
+    match = MAX_AGE_RE.search(cache_control)
+    return int(match.group(1)) if match else 0
+
+
+def read_body(response, limit=None):
+    """Read at most `limit` (default MAX_BODY_BYTES) bytes of a streamed body."""
+    limit = limit or MAX_BODY_BYTES
+    chunks = []
+    size = 0
+    for chunk in response.iter_content(CHUNK_SIZE):
+        chunks.append(chunk)
+        size += len(chunk)
+        if size >= limit:
+            break
+    return b''.join(chunks)[:limit]
+
+
+def fetch_page(url, timeout=TIMEOUT):
+    """Return the decoded body of `url`, using the page cache when valid.
+
+    Fresh entries (per Cache-Control max-age) are served without a request;
+    stale ones are revalidated with If-None-Match/If-Modified-Since. Bodies
+    larger than MAX_BODY_BYTES are cut off. HTTP errors raise.
+    """
+    key = make_key(url)
+    meta, body = _load(key)
+    if meta and time.time() - meta['fetched_at'] < meta['max_age']:
+        return body.decode(meta['encoding'], errors='replace')
+
+    headers = {}
+    if meta:
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    with domain_slot(url):
+        with get_session().get(url, headers=headers, timeout=timeout, stream=True) as response:
+            if response.status_code == 304 and meta:
+                meta['fetched_at'] = time.time()
+                meta['max_age'] = _max_age(response) or meta['max_age']
+                _save(key, meta, body)
+                return body.decode(meta['encoding'], errors='replace')
+
+            response.raise_for_status()
+            body = read_body(response)
+            bytes_total.inc('fetch', amount=len(body))
+            meta = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'max_age': _max_age(response),
+                'fetched_at': time.time(),
+                'encoding': response.encoding or 'utf-8',
+            }
+
+    if meta['etag'] or meta['last_modified'] or meta['max_age']:
+        _save(key, meta, body)
+    return body.decode(meta['encoding'], errors='replace')
@@ -0,0 +1,243 @@
+"""Gemini client layer: adaptive concurrency, retries, circuit breaker, deadlines.
+
+Every model call goes through GeminiClient.generate_content, which mirrors
+the SDK method. In-flight calls are capped by an AIMD limit that grows by
+about one per round of successes and halves on a 429 or a timeout. 429s
+and 5xx are retried with jittered exponential backoff, or after the delay
+the server asked for, as long as the call's deadline allows. After a run
+of failures the circuit opens and calls fail fast with Unavailable until a
+probe call gets through; calls that run out of retries raise it too. The
+SDK's own retries are switched off so these are the only ones.
+"""
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger('huxe')
+
+TIMEOUT = float(os.environ.get('GEMINI_TIMEOUT', '60'))  # seconds per attempt
+DEADLINE = float(os.environ.get('GEMINI_DEADLINE', '120'))  # seconds per call, retries included
+MAX_RETRIES = int(os.environ.get('GEMINI_MAX_RETRIES', '4'))
+BACKOFF_BASE = float(os.environ.get('GEMINI_BACKOFF_BASE', '1.0'))  # seconds
+INITIAL_CONCURRENCY = int(os.environ.get('GEMINI_INITIAL_CONCURRENCY', '8'))
+MAX_CONCURRENCY = int(os.environ.get('GEMINI_MAX_CONCURRENCY', '64'))
+BREAKER_THRESHOLD = int(os.environ.get('GEMINI_BREAKER_THRESHOLD', '5'))  # failures in a row
+BREAKER_COOLDOWN = float(os.environ.get('GEMINI_BREAKER_COOLDOWN', '30'))  # seconds
+
+
+class Unavailable(Exception):
+    """Gemini is overloaded or failing, so the call was given up on."""
+
+
+def classify(error):
+    """'overload', 'timeout' or 'server' for errors worth retrying, else None.
+
+    API errors carry their HTTP status as `code`; nothing from the SDK is
+    imported here, so the app can start without loading it.
+    """
+    code = getattr(error, 'code', None)
+    if code == 429:
+        return 'overload'
+    if code == 504 or isinstance(error, TimeoutError):
+        return 'timeout'
+    if code in (500, 502, 503) or isinstance(error, ConnectionError):
+        return 'server'
+    return None
+
+
+def retry_delay(error):
+    """Seconds the server asked us to wait before retrying (RetryInfo), if any."""
+    for detail in getattr(error, 'details', None) or ():
+        delay = getattr(detail, 'retry_delay', None)
+        if delay is not None and hasattr(delay, 'seconds'):
+            return delay.seconds + delay.nanos / 1e9
+        if isinstance(detail, dict) and str(detail.get('retryDelay', '')).endswith('s'):
+            try:
+                return float(detail['retryDelay'][:-1])
+            except ValueError:
+                pass
+    return None
+
+
+class AdaptiveLimit:
+    """AIMD cap on concurrent calls.
+
+    Each success raises the limit by 1/limit (about +1 per full round of
+    calls); an overload or timeout halves it, at most once per
+    `decrease_interval` so one burst of failures counts once.
+    """
+
+    def __init__(self, initial=INITIAL_CONCURRENCY, minimum=1, maximum=MAX_CONCURRENCY,
+                 decrease_interval=1.0):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease_interval = decrease_interval
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout):
+        """Take a slot, waiting up to `timeout` seconds; False if none came free."""
+        end = time.monotonic() + timeout
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self.in_flight += 1
+            return True
+
+    def release(self, outcome):
+        """Give a slot back; `outcome` is 'success', a classify() kind, or None."""
+        with self._cond:
+            self.in_flight -= 1
+            if outcome == 'success':
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            elif outcome in ('overload', 'timeout'):
+                now = time.monotonic()
+                if now - self._last_decrease >= self.decrease_interval:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self._last_decrease = now
+            self._cond.notify_all()
+
+
+class CircuitBreaker:
+    """Opens after `threshold` failures in a row; after `cooldown` one probe may try."""
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.probing or time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.probing = True  # half-open: this caller is the probe
+            return True
+
+    def record(self, healthy):
+        with self._lock:
+            if healthy:
+                if self.opened_at is not None:
+                    logger.info('Gemini circuit closed')
+                self.failures = 0
+                self.opened_at = None
+                self.probing = False
+                return
+            self.failures += 1
+            if self.probing or self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logger.warning('Gemini circuit open after %d failures', self.failures)
+                self.opened_at = time.monotonic()
+                self.probing = False
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+
+class GeminiClient:
+    """Wraps the model returned by `get_model` (looked up on every call)."""
+
+    def __init__(self, get_model, limit=None, breaker=None, timeout=TIMEOUT,
+                 deadline=DEADLINE, retries=MAX_RETRIES, backoff=BACKOFF_BASE):
+        self.get_model = get_model
+        self.limit = limit or AdaptiveLimit()
+        self.breaker = breaker or CircuitBreaker()
+        self.timeout = timeout
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.counts = {'calls': 0, 'retries': 0, 'failures': 0, 'rejected': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def _reject(self, reason):
+        self._count('rejected')
+        raise Unavailable(reason)
+
+    def generate_content(self, prompt, stream=False, deadline=None, **kwargs):
+        """Call the model's generate_content under the limit, retries and deadline.
+
+        With stream=True only the wait for the first chunk is retried; the
+        slot is held until the returned iterator is exhausted or closed.
+        Overload, timeout and server errors that outlast the retries are
+        raised as Unavailable, chained from the SDK's error.
+        """
+        self._count('calls')
+        end = time.monotonic() + (deadline or self.deadline)
+        for attempt in range(self.retries + 1):
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                self._reject('Gemini call deadline passed')
+            if not self.limit.acquire(remaining):
+                self._reject('Too many Gemini calls in flight')
+            if not self.breaker.allow():
+                self.limit.release(None)
+                self._reject('Gemini circuit is open')
+
+            options = {'timeout': min(self.timeout, max(0.1, end - time.monotonic())),
+                       'retry': None}
+            try:
+                response = self.get_model().generate_content(
+                    prompt, stream=stream, request_options=options, **kwargs)
+                if stream:
+                    chunks = iter(response)
+                    first = next(chunks, None)
+            except Exception as e:
+                kind = classify(e)
+                self.limit.release(kind)
+                # An error the API answered with (bad request, blocked
+                # prompt) still means the API is up
+                self.breaker.record(kind is None)
+                if kind is None:
+                    raise
+                self._count('failures')
+                delay = retry_delay(e) or self.backoff * (2 ** attempt) * (0.5 + random.random())
+                if attempt == self.retries or time.monotonic() + delay >= end:
+                    raise Unavailable(f'Gemini {kind} after {attempt + 1} attempts') from e
+                logger.warning('Gemini %s (%s); retrying in %.1fs', kind, e, delay)
+                self._count('retries')
+                time.sleep(delay)
+                continue
+
+            self.breaker.record(True)
+            if not stream:
+                self.limit.release('success')
+                return response
+            return self._relay(first, chunks)
+
+    def _relay(self, first, chunks):
+        outcome = 'success'
+        try:
+            if first is not None:
+                yield first
+            for chunk in chunks:
+                yield chunk
+        except Exception as e:
+            outcome = classify(e)
+            if outcome is not None:
+                raise Unavailable(f'Gemini {outcome} mid-stream') from e
+            raise
+        finally:
+            self.limit.release(outcome)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counts)
+        stats.update(limit=round(self.limit.limit, 2), in_flight=self.limit.in_flight,
+                     circuit_open=int(self.breaker.is_open))
+        return stats
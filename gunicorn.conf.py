@@ -0,0 +1,27 @@
+"""Gunicorn settings, read from the working directory by `gunicorn app:app`.
+
+Pipelines run as coroutines on each process's async core (aio.py), so a
+request thread only waits on a future, and /api/jobs/<id>/events holds a
+connection open for the length of a generation. The threaded worker gives
+every such request a cheap thread instead of a whole process.
+"""
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5001')
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', '64'))
+# Generations on the synchronous form POST take a while; this is the
+# worker heartbeat for gthread, not a per-request limit
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+keepalive = 5
+# GUNICORN_PRELOAD=1 imports the app in the master, so workers boot by
+# forking instead of importing; see app.preload()
+preload_app = os.environ.get('GUNICORN_PRELOAD') == '1'
+
+
+def when_ready(server):
+    # Runs in the master before the first workers are forked
+    if preload_app:
+        from app import preload
+        preload()
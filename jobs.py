@@ -0,0 +1,257 @@
+"""SQLite-backed job queue and worker processes for podcast generation.
+
+The web process enqueues jobs and returns right away; worker processes
+claim them, run the pipeline and record progress, so a gunicorn worker is
+never tied up for the length of a generation. Each worker process runs up
+to JOB_CONCURRENCY jobs at once on its async core. Run `python jobs.py` to
+start a standalone pool, or let the web app start one on first use.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger('huxe')
+
+DB_PATH = os.environ.get('JOBS_DB', 'jobs.db')
+WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+# Jobs each worker process runs at once; they mostly wait on the async core
+JOB_CONCURRENCY = int(os.environ.get('JOB_CONCURRENCY', '16'))
+POLL_INTERVAL = 0.5  # seconds between queue polls when idle
+STALE_AFTER = 600  # seconds before a silent running job is handed out again
+MAX_QUEUED = int(os.environ.get('JOB_QUEUE_MAX', '1000'))  # queued jobs before new ones are refused
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    stage TEXT,
+    progress TEXT,
+    params TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+)
+'''
+
+
+class JobQueue:
+    """Jobs table with atomic claim, shared by the web app and the workers."""
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(SCHEMA)
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(jobs)')}
+            if 'progress' not in columns:
+                # Databases created before per-line progress was tracked
+                conn.execute('ALTER TABLE jobs ADD COLUMN progress TEXT')
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def enqueue(self, params, status='queued'):
+        """Add a job and return its ID.
+
+        Workers only claim 'queued' jobs; a 'stream' job waits for the web
+        process that serves /stream/<id> to take() it.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO jobs (id, status, stage, params, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (job_id, status, status, json.dumps(params), now, now))
+        return job_id
+
+    def take(self, job_id, status, max_age):
+        """Atomically move a job out of `status`, returning its params.
+
+        None if it doesn't exist, was already taken or is older than
+        `max_age` seconds. Taken jobs are marked 'taken'.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "UPDATE jobs SET status = 'taken', stage = 'taken', updated_at = ? "
+                'WHERE id = ? AND status = ? AND created_at > ? RETURNING params',
+                (now, job_id, status, now - max_age)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def queued(self):
+        """Number of jobs waiting to be claimed."""
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def claim(self):
+        """Take the oldest runnable job, returning (job_id, params) or None."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                "SELECT id, params FROM jobs WHERE status = 'queued' "
+                "OR (status = 'running' AND updated_at < ?) "
+                "ORDER BY created_at LIMIT 1", (now - STALE_AFTER,)).fetchone()
+            if row:
+                conn.execute("UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ?",
+                             (now, row[0]))
+            conn.execute('COMMIT')
+        except Exception:
+            # BEGIN itself fails when the lock can't be had in time
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def update(self, job_id, **fields):
+        """Set status/stage/progress/result/error on a job and bump its heartbeat."""
+        for name in ('result', 'progress'):
+            if name in fields:
+                fields[name] = json.dumps(fields[name])
+        fields['updated_at'] = time.time()
+        columns = ', '.join(f'{name} = ?' for name in fields)
+        with self._connect() as conn:
+            conn.execute(f'UPDATE jobs SET {columns} WHERE id = ?',
+                         (*fields.values(), job_id))
+
+    def prune(self, max_age):
+        """Delete finished (or never played stream) jobs idle for `max_age` seconds."""
+        with self._connect() as conn:
+            return conn.execute(
+                "DELETE FROM jobs WHERE status NOT IN ('queued', 'running') "
+                'AND updated_at < ?', (time.time() - max_age,)).rowcount
+
+    def get(self, job_id):
+        """Return a job as a dict, or None if it doesn't exist."""
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT id, status, stage, progress, result, error, created_at, updated_at '
+                'FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if not row:
+            return None
+        return {
+            'id': row[0],
+            'status': row[1],
+            'stage': row[2],
+            'progress': json.loads(row[3]) if row[3] else None,
+            'result': json.loads(row[4]) if row[4] else None,
+            'error': row[5],
+            'created_at': row[6],
+            'updated_at': row[7],
+        }
+
+
+# Progress is reported from the async core's event loop, which must not wait
+# on SQLite locks, so writes are queued to one thread. Final updates go
+# through it too, keeping them ordered after the job's last progress write.
+progress_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='job-progress')
+
+
+def run_job(queue, job_id, params):
+    """Run one job through the pipeline, recording progress as it goes."""
+    from app import PipelineError, run_pipeline
+    from metrics import new_trace
+
+    new_trace()
+
+    def progress(stage, done=None, total=None):
+        if total is None:
+            progress_writer.submit(queue.update, job_id, stage=stage)
+        else:
+            progress_writer.submit(queue.update, job_id, stage=stage,
+                                   progress={'done': done, 'total': total})
+
+    try:
+        # Jobs are already queued, so they wait for admission rather than shed
+        result = run_pipeline(params.get('text', ''), params.get('length', 'medium'),
+                              url=params.get('url'), progress=progress, shed=False)
+    except PipelineError as e:
+        final = {'status': 'failed', 'stage': 'failed', 'error': str(e)}
+    except Exception:
+        final = {'status': 'failed', 'stage': 'failed',
+                 'error': "Something went wrong while generating the podcast. Please try again."}
+    else:
+        final = {'status': 'done', 'stage': 'done', 'result': result}
+    progress_writer.submit(queue.update, job_id, **final).result()
+
+
+def claim_loop(queue, concurrency=JOB_CONCURRENCY):
+    """Claim jobs for `concurrency` runner threads until the process exits.
+
+    One thread per process polls the queue, and only while a runner is free,
+    so idle and busy workers alike take the write lock at most every
+    POLL_INTERVAL instead of once per runner.
+    """
+    concurrency = max(1, concurrency)
+    free = threading.Semaphore(concurrency)
+    runners = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='job')
+
+    def run(job_id, params):
+        try:
+            run_job(queue, job_id, params)
+        finally:
+            free.release()
+
+    while True:
+        free.acquire()
+        try:
+            job = queue.claim()
+        except Exception:
+            # e.g. "database is locked"; this thread is the process's only claimer
+            logger.exception('Claiming a job failed')
+            job = None
+        if job is None:
+            free.release()
+            time.sleep(POLL_INTERVAL)
+            continue
+        runners.submit(run, *job)
+
+
+def worker_main(path=DB_PATH, concurrency=JOB_CONCURRENCY):
+    """Worker process: one claimer feeding `concurrency` jobs on one async core."""
+    from metrics import start_flusher
+
+    # The web app's /metrics reads these; this process is never scraped
+    start_flusher()
+    claim_loop(JobQueue(path), concurrency)
+
+
+def start_workers(count=WORKERS, path=DB_PATH):
+    """Start `count` daemon worker processes and return them."""
+    context = multiprocessing.get_context('spawn')
+    processes = []
+    for _ in range(count):
+        process = context.Process(target=worker_main, args=(path,), daemon=True)
+        process.start()
+        processes.append(process)
+    return processes
+
+
+_started = False
+_started_lock = threading.Lock()
+
+
+def ensure_workers():
+    """Start the worker pool once per web process (no-op if JOB_WORKERS=0)."""
+    global _started
+    with _started_lock:
+        if not _started and WORKERS > 0:
+            start_workers()
+        _started = True
+
+
+if __name__ == '__main__':
+    for process in start_workers():
+        process.join()
@@ -0,0 +1,228 @@
+"""Lightweight timing spans, counters and a Prometheus text exposition.
+
+Recording is a lock, a bisect and a few additions, so it stays on in
+production. Each process keeps its own numbers and, once start_flusher()
+has run, writes them to METRICS_DIR/<pid>.json every few seconds. render()
+adds up the counters and histograms of every live process there (gunicorn
+workers and job workers alike), so whichever process is scraped reports
+the whole deployment. Stats gauges are per process and get a `pid` label.
+"""
+import bisect
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger('huxe')
+
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join('.cache', 'metrics'))
+FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', '5'))  # seconds
+STALE_AFTER = 600  # seconds before a silent (exited) process's numbers are dropped
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+trace_id = contextvars.ContextVar('trace_id', default='-')
+
+
+def new_trace():
+    """Start a new trace for the current request or job and return its ID."""
+    value = uuid.uuid4().hex[:16]
+    trace_id.set(value)
+    return value
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{value}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(values), total] for values, total in self._values.items()]
+
+    def render(self, others=()):
+        """Exposition lines, adding in `others` (snapshots of other processes)."""
+        with self._lock:
+            merged = dict(self._values)
+        for snapshot in others:
+            for values, total in snapshot:
+                merged[tuple(values)] = merged.get(tuple(values), 0) + total
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for values, total in sorted(merged.items()):
+            lines.append(f'{self.name}{_labels(self.label_names, values)} {total}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(values), list(series)] for values, series in self._series.items()]
+
+    def render(self, others=()):
+        """Exposition lines, adding in `others` (snapshots of other processes)."""
+        with self._lock:
+            merged = {k: list(v) for k, v in self._series.items()}
+        for snapshot in others:
+            for values, series in snapshot:
+                current = merged.setdefault(tuple(values), [0] * len(series))
+                if len(current) == len(series):  # same buckets
+                    merged[tuple(values)] = [a + b for a, b in zip(current, series)]
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for values, series in sorted(merged.items()):
+            names = self.label_names + ('le',)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_labels(names, values + (bound,))} {cumulative}')
+            labels = _labels(self.label_names, values)
+            lines.append(f'{self.name}_sum{labels} {series[-1]:.6f}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+REGISTRY = []
+COLLECTORS = []  # (name, help, fn returning {label value: number}, label name)
+
+
+def register_stats(name, help, fn, label='kind'):
+    """Expose a stats() dict (e.g. cache hits/misses) as a labelled gauge."""
+    COLLECTORS.append((name, help, fn, label))
+
+
+stage_seconds = Histogram('huxe_stage_seconds', 'Time spent in each pipeline stage.',
+                          labels=('stage',))
+stage_errors = Counter('huxe_stage_errors_total', 'Pipeline stages that raised.',
+                       labels=('stage',))
+tts_call_seconds = Histogram('huxe_tts_call_seconds', 'Latency of single TTS backend calls.',
+                             labels=('host',))
+tts_errors = Counter('huxe_tts_errors_total', 'Failed TTS backend calls (before retry).',
+                     labels=('host',))
+bytes_total = Counter('huxe_bytes_total', 'Bytes moved by each stage.', labels=('stage',))
+
+
+@contextmanager
+def span(stage):
+    """Time a block into huxe_stage_seconds and log it with the trace ID."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        stage_errors.inc(stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage)
+        logger.info('trace=%s stage=%s seconds=%.3f', trace_id.get(), stage, elapsed)
+
+
+def flush(directory=METRICS_DIR):
+    """Write this process's numbers where other processes' render() reads them."""
+    snapshot = {'metrics': {metric.name: metric.snapshot() for metric in REGISTRY},
+                'gauges': {name: fn() for name, _, fn, _ in COLLECTORS}}
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{os.getpid()}.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(path + '.tmp', path)
+
+
+def read_others(directory=METRICS_DIR):
+    """{pid: snapshot} of the other processes that flushed recently."""
+    others = {}
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return others
+    now = time.time()
+    for name in names:
+        pid, _, ext = name.partition('.')
+        if ext != 'json' or pid == str(os.getpid()):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            if now - os.path.getmtime(path) > STALE_AFTER:
+                os.remove(path)
+                continue
+            with open(path) as f:
+                others[pid] = json.load(f)
+        except (OSError, ValueError):
+            continue  # exited or mid-replace
+    return others
+
+
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+
+
+def start_flusher(interval=FLUSH_INTERVAL, directory=METRICS_DIR):
+    """Call flush() every `interval` seconds on a daemon thread, once per process."""
+    global _flusher_pid
+    with _flusher_lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+
+    def loop():
+        while True:
+            try:
+                flush(directory)
+            except Exception:
+                logger.exception('Flushing metrics failed')
+            time.sleep(interval)
+
+    threading.Thread(target=loop, name='metrics-flusher', daemon=True).start()
+
+
+def render():
+    """All metrics in Prometheus text exposition format, across processes."""
+    others = read_others()
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render(
+            [other['metrics'].get(metric.name, ()) for other in others.values()]))
+    gauges = [(str(os.getpid()), {name: fn() for name, _, fn, _ in COLLECTORS})]
+    gauges += [(pid, other['gauges']) for pid, other in sorted(others.items())]
+    for name, help, _, label in COLLECTORS:
+        lines.append(f'# HELP {name} {help}')
+        lines.append(f'# TYPE {name} gauge')
+        for pid, values in gauges:
+            for key, value in sorted(values.get(name, {}).items()):
+                lines.append(f'{name}{{{label}="{key}",pid="{pid}"}} {value}')
+    return '\n'.join(lines) + '\n'
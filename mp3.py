@@ -0,0 +1,83 @@
+"""Just enough MP3 framing to concatenate gTTS segments cleanly.
+
+Each segment can carry an ID3v2 tag up front, an ID3v1 tag at the end and
+a Xing/Info (or VBRI) frame describing only that segment. Left in place,
+players read the first segment's info frame and report the wrong duration
+and seek to the wrong offsets, so we cut them before joining.
+"""
+
+# Layer III bitrates in kbps, indexed by the header's bitrate field
+BITRATES_V1 = (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320)
+BITRATES_V2 = (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+SAMPLE_RATES = {
+    3: (44100, 48000, 32000),  # MPEG 1
+    2: (22050, 24000, 16000),  # MPEG 2
+    0: (11025, 12000, 8000),   # MPEG 2.5
+}
+
+
+def id3v2_size(data):
+    """Length of a leading ID3v2 tag (0 if there isn't one)."""
+    if len(data) < 10 or bytes(data[:3]) != b'ID3':
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def frame_info(data, offset):
+    """Return (frame_length, side_info_length) for a Layer III header, or None."""
+    if offset + 4 > len(data):
+        return None
+    b1, b2, b3 = data[offset + 1], data[offset + 2], data[offset + 3]
+    if data[offset] != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+    version = (b1 >> 3) & 0x03
+    layer = (b1 >> 1) & 0x03
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 0x03
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    mono = (b3 >> 6) == 3
+    padding = (b2 >> 1) & 0x01
+    sample_rate = SAMPLE_RATES[version][rate_index]
+    if version == 3:
+        bitrate = BITRATES_V1[bitrate_index] * 1000
+        length = 144 * bitrate // sample_rate + padding
+        side_info = 17 if mono else 32
+    else:
+        bitrate = BITRATES_V2[bitrate_index] * 1000
+        length = 72 * bitrate // sample_rate + padding
+        side_info = 9 if mono else 17
+    return length, side_info
+
+
+def strip_headers(data):
+    """Return a memoryview of `data` without ID3 tags or a leading VBR info frame."""
+    view = memoryview(data)
+    start = id3v2_size(view)
+    end = len(view)
+    if end - start >= 128 and bytes(view[end - 128:end - 125]) == b'TAG':
+        end -= 128
+
+    info = frame_info(view, start)
+    if info:
+        length, side_info = info
+        marker = 4 + side_info
+        tag = bytes(view[start + marker:start + marker + 4])
+        vbri = bytes(view[start + 36:start + 40])
+        if tag in (b'Xing', b'Info') or vbri == b'VBRI':
+            start = min(start + length, end)
+    return view[start:end]
+
+
+def write_segments(segments, outfile):
+    """Write MP3 segments to an open binary file without extra copies.
+
+    Segments must already be stripped: synthesize_lines strips each
+    sentence, and running strip_headers again over joined audio could
+    mistake real frames for a trailing ID3v1 tag.
+    """
+    for segment in segments:
+        outfile.write(segment)
@@ -0,0 +1,146 @@
+"""Podcast scripts as structured turns.
+
+Gemini is asked for JSON ({"turns": [{"host": "Alex", "text": "..."}]}),
+which is validated once into a tuple of Turn. Synthesis, the script cache
+(compact JSON) and the page all work from those turns, so a script is
+never re-parsed from free text. TurnParser does the same for streamed
+output, handing over each turn as soon as it is complete.
+"""
+import json
+import re
+from collections import namedtuple
+
+HOSTS = ('Alex', 'Sam')
+_HOST_NAMES = {host.lower(): host for host in HOSTS}
+
+Turn = namedtuple('Turn', ['host', 'text'])
+
+SCRIPT_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'turns': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'host': {'type': 'string', 'format': 'enum', 'enum': list(HOSTS)},
+                    'text': {'type': 'string'},
+                },
+                'required': ['host', 'text'],
+            },
+        },
+    },
+    'required': ['turns'],
+}
+GENERATION_CONFIG = {'response_mime_type': 'application/json',
+                     'response_schema': SCRIPT_SCHEMA}
+
+# Characters that matter to TurnParser; everything else is skipped over
+_TOKEN_RE = re.compile(r'[{}"\\]')
+
+
+class ScriptError(ValueError):
+    """Model output that isn't a usable script."""
+
+
+def make_turn(item):
+    """Validate one {"host", "text"} object into a Turn, or None if it says nothing."""
+    if not isinstance(item, dict):
+        raise ScriptError(f'Expected a turn object, got {item!r:.80}')
+    host, text = item.get('host'), item.get('text')
+    if not isinstance(host, str) or not isinstance(text, str):
+        raise ScriptError(f'Turn needs string "host" and "text": {item!r:.80}')
+    name = _HOST_NAMES.get(host.strip().lower())
+    if name is None:
+        raise ScriptError(f'Unknown host {host!r}')
+    text = ' '.join(text.split())
+    return Turn(name, text) if text else None
+
+
+def parse_script(data):
+    """Validate a complete JSON script into a tuple of Turns."""
+    try:
+        value = json.loads(data)
+    except ValueError as e:
+        raise ScriptError(f'Script is not valid JSON: {e}') from e
+    items = value.get('turns') if isinstance(value, dict) else value
+    if not isinstance(items, list):
+        raise ScriptError('Script has no list of turns')
+    turns = tuple(turn for turn in map(make_turn, items) if turn)
+    if not turns:
+        raise ScriptError('Script has no turns')
+    return turns
+
+
+def dump_script(turns):
+    """Compact JSON for a validated script; parse_script reads it back."""
+    return json.dumps({'turns': [turn._asdict() for turn in turns]},
+                      ensure_ascii=False, separators=(',', ':'))
+
+
+def format_script(turns):
+    """The script as a plain "Host: text" transcript."""
+    return '\n'.join(f'{turn.host}: {turn.text}' for turn in turns)
+
+
+def script_lines(turns):
+    """Turns as the page and the API show them."""
+    return [{'host': turn.host.lower(), 'text': turn.text} for turn in turns]
+
+
+class TurnParser:
+    """Incremental parser for streamed JSON scripts.
+
+    Turns are the innermost objects of the output, so the parser only
+    tracks strings and brace nesting, and decodes each innermost object as
+    soon as it closes, whatever it is wrapped in. feed() returns the turns
+    completed by a chunk; close() returns all of them.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.position = 0  # next offset to scan
+        self.in_string = False
+        self.open = []  # [start offset, has nested object] per open object
+        self.turns = []
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        found = []
+        position = self.position
+        while True:
+            match = _TOKEN_RE.search(self.buffer, position)
+            if not match:
+                break
+            index, char = match.start(), match.group()
+            position = index + 1
+            if self.in_string:
+                if char == '\\':
+                    position = index + 2  # skip the escaped character
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char == '{':
+                if self.open:
+                    self.open[-1][1] = True
+                self.open.append([index, False])
+            elif char == '}' and self.open:
+                start, nested = self.open.pop()
+                if not nested:
+                    try:
+                        item = json.loads(self.buffer[start:index + 1])
+                    except ValueError as e:
+                        raise ScriptError(f'Malformed turn in script: {e}') from e
+                    turn = make_turn(item)
+                    if turn:
+                        found.append(turn)
+        self.position = max(position, len(self.buffer))
+        self.turns.extend(found)
+        return found
+
+    def close(self):
+        """All turns of the finished stream; raises ScriptError if there were none."""
+        if not self.turns:
+            raise ScriptError('Script has no turns')
+        return tuple(self.turns)
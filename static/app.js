@@ -0,0 +1,158 @@
+function switchTab(tab) {
+    document.querySelectorAll('.tab').forEach(t => t.classList.remove('active'));
+    document.querySelectorAll('.tab-content').forEach(c => c.classList.remove('active'));
+
+    if (tab === 'text') {
+        document.querySelector('.tab:first-child').classList.add('active');
+        document.getElementById('textTab').classList.add('active');
+        document.getElementById('inputType').value = 'text';
+        document.getElementById('urlInput').value = '';
+    } else {
+        document.querySelector('.tab:last-child').classList.add('active');
+        document.getElementById('urlTab').classList.add('active');
+        document.getElementById('inputType').value = 'url';
+        document.getElementById('textInput').value = '';
+    }
+}
+
+const STAGE_LABELS = {
+    queued: 'Waiting in line...',
+    fetching: 'Reading the article...',
+    script: 'Writing the script...',
+    audio: 'Recording voices...',
+    combining: 'Putting it together...'
+};
+
+function setStatus(label) {
+    document.getElementById('submitBtn').textContent = label;
+}
+
+function resetButton() {
+    document.getElementById('submitBtn').disabled = false;
+    setStatus('Generate Podcast');
+}
+
+function showError(message) {
+    let box = document.getElementById('errorBox');
+    if (!box) {
+        box = document.createElement('div');
+        box.id = 'errorBox';
+        box.className = 'error';
+        document.getElementById('generateForm').after(box);
+    }
+    box.textContent = message;
+}
+
+function showResult(result) {
+    const section = document.getElementById('resultSection');
+    section.innerHTML = '<div class="section-title">Output</div>';
+
+    const audioSection = document.createElement('div');
+    audioSection.className = 'audio-section';
+    const audio = document.createElement('audio');
+    audio.controls = true;
+    audio.autoplay = true;
+    result.audio_sources.forEach(function(item) {
+        const source = document.createElement('source');
+        source.src = item.url;
+        source.type = item.type;
+        audio.append(source);
+    });
+    const download = document.createElement('a');
+    download.href = result.download_url;
+    download.style.textDecoration = 'none';
+    download.innerHTML = '<button type="button" class="download-btn">Download MP3</button>';
+    audioSection.append(audio, download);
+
+    const scriptSection = document.createElement('div');
+    scriptSection.className = 'script-section';
+    scriptSection.innerHTML = '<div class="section-title">Script</div>';
+    const container = document.createElement('div');
+    container.className = 'script-container';
+    result.script_lines.forEach(function(line) {
+        const row = document.createElement('div');
+        row.className = 'script-line ' + line.host;
+        const name = document.createElement('span');
+        name.className = 'host-name';
+        name.textContent = line.host === 'alex' ? 'Alex:' : 'Sam:';
+        row.append(name, document.createTextNode(line.text));
+        container.append(row);
+    });
+    scriptSection.append(container);
+    section.append(audioSection, scriptSection);
+}
+
+document.getElementById('generateForm').onsubmit = async function(event) {
+    document.getElementById('submitBtn').disabled = true;
+    if (!window.EventSource || !window.fetch) {
+        // Old browsers: fall back to the blocking form post
+        setStatus('Generating... (30-60 seconds)');
+        return;
+    }
+    event.preventDefault();
+    setStatus('Starting...');
+    const box = document.getElementById('errorBox');
+    if (box) box.remove();
+
+    let job;
+    try {
+        const response = await fetch('/api/jobs', {method: 'POST', body: new FormData(this)});
+        job = await response.json();
+        if (!response.ok) throw new Error(job.error);
+    } catch (err) {
+        showError(err.message || 'Could not start generation. Please try again.');
+        resetButton();
+        return;
+    }
+
+    // Progress and the result come over server-sent events; if those
+    // fail (a proxy drops them, a 404), poll the job instead
+    let finished = false;
+    function handle(update) {
+        if (finished) return;
+        if (update.status === 'done') {
+            finished = true;
+            showResult(update.result);
+            resetButton();
+        } else if (update.status === 'failed') {
+            finished = true;
+            showError(update.error);
+            resetButton();
+        } else {
+            let label = STAGE_LABELS[update.stage] || 'Generating...';
+            if (update.stage === 'audio' && update.progress) {
+                label = 'Recording voices... line ' + update.progress.done + ' of ' + update.progress.total;
+            }
+            setStatus(label);
+        }
+    }
+
+    async function poll() {
+        while (!finished) {
+            try {
+                const response = await fetch(job.status_url);
+                const update = await response.json();
+                if (!response.ok) throw new Error(update.error);
+                handle(update);
+            } catch (err) {
+                finished = true;
+                showError('Lost track of the generation. Please try again.');
+                resetButton();
+                return;
+            }
+            await new Promise(resolve => setTimeout(resolve, 2000));
+        }
+    }
+
+    const events = new EventSource('/api/jobs/' + job.job_id + '/events');
+    ['progress', 'done', 'failed'].forEach(function(name) {
+        events.addEventListener(name, function(e) {
+            if (name !== 'progress') events.close();
+            handle(JSON.parse(e.data));
+        });
+    });
+    events.onerror = function() {
+        events.close();
+        if (!finished) poll();
+    };
+};
@@ -0,0 +1,133 @@
+"""Compact speech encodings of finished podcasts, made by a local ffmpeg.
+
+The combined MP3 stays the canonical artifact. Once it is stored, each
+format in AUDIO_ENCODINGS is transcoded in the background and stored next
+to it as <hash>-<format>.<ext>, and /audio picks one per client. Without
+ffmpeg on the PATH nothing is transcoded and every client gets the MP3.
+"""
+import logging
+import os
+import shutil
+import subprocess
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import bytes_total, span
+
+logger = logging.getLogger('huxe')
+
+FFMPEG = os.environ.get('FFMPEG', 'ffmpeg')
+ENCODINGS = [name.strip() for name in
+             os.environ.get('AUDIO_ENCODINGS', 'opus').split(',') if name.strip()]
+# ffmpeg processes running at once per app process; each is held to one thread
+TRANSCODE_WORKERS = int(os.environ.get('TRANSCODE_WORKERS',
+                                       str(max(1, (os.cpu_count() or 2) // 2))))
+TRANSCODE_TIMEOUT = 300  # seconds
+
+Encoding = namedtuple('Encoding', ['ext', 'mimetype', 'args'])
+
+# Tuned for two voices talking: mono, speech bandwidth, no metadata
+FORMATS = {
+    # Opus in Ogg, VoIP mode: 12 kbit/s against gTTS's 32 kbit/s MP3
+    'opus': Encoding('opus', 'audio/ogg; codecs=opus',
+                     ['-ac', '1', '-c:a', 'libopus', '-b:a', '12k', '-application', 'voip',
+                      '-f', 'ogg']),
+    # MP3 for players without Opus: 16 kHz at 16 kbit/s, half of gTTS's
+    'mono': Encoding('mp3', 'audio/mpeg',
+                     ['-ac', '1', '-ar', '16000', '-c:a', 'libmp3lame', '-b:a', '16k',
+                      '-write_xing', '0', '-id3v2_version', '0', '-f', 'mp3']),
+}
+
+
+def variant_name(name, encoding):
+    """Store name of the `encoding` version of the stored MP3 `name`."""
+    return f"{name.rsplit('.', 1)[0]}-{encoding}.{FORMATS[encoding].ext}"
+
+
+class Transcoder:
+    """Makes the compact encodings of stored podcasts off the request path.
+
+    ffmpeg runs as a child process per file; a small thread pool only waits
+    on them and caps how many run at once. Each (file, encoding) is queued
+    at most once at a time.
+    """
+
+    def __init__(self, store, encodings=ENCODINGS, ffmpeg=FFMPEG, workers=TRANSCODE_WORKERS):
+        for encoding in encodings:
+            if encoding not in FORMATS:
+                raise ValueError(f'Unknown audio encoding {encoding!r}')
+        self.store = store
+        self.encodings = list(encodings)
+        self.ffmpeg = ffmpeg
+        self.workers = workers
+        self.counts = {'done': 0, 'failed': 0, 'bytes_in': 0, 'bytes_out': 0}
+        self._pending = set()
+        self._available = None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def available(self):
+        if self._available is None:
+            self._available = bool(self.encodings and shutil.which(self.ffmpeg))
+        return self._available
+
+    def variants(self, name):
+        """{encoding: store name} of the encodings of `name` made so far."""
+        found = {}
+        for encoding in self.encodings:
+            variant = variant_name(name, encoding)
+            if self.store.path(variant):
+                found[encoding] = variant
+        return found
+
+    def submit(self, name, encodings=None):
+        """Queue the missing encodings of the stored MP3 `name`; never blocks."""
+        if not self.available():
+            return
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers,
+                                                    thread_name_prefix='transcode')
+            for encoding in encodings or self.encodings:
+                if (name, encoding) in self._pending or self.store.path(
+                        variant_name(name, encoding)):
+                    continue
+                self._pending.add((name, encoding))
+                self._executor.submit(self._transcode, name, encoding)
+
+    def _transcode(self, name, encoding):
+        try:
+            source = self.store.path(name)
+            if source is None:
+                return  # swept before its turn came
+            fmt = FORMATS[encoding]
+            with self.store.workdir() as workdir, span('transcode'):
+                output = os.path.join(workdir, f'audio.{fmt.ext}')
+                subprocess.run(
+                    [self.ffmpeg, '-hide_banner', '-loglevel', 'error', '-i', source,
+                     '-map_metadata', '-1', '-threads', '1', *fmt.args, output],
+                    capture_output=True, check=True, timeout=TRANSCODE_TIMEOUT)
+                size_in, size_out = os.path.getsize(source), os.path.getsize(output)
+                self.store.store_derived(output, variant_name(name, encoding))
+            bytes_total.inc('transcode', amount=size_out)
+            with self._lock:
+                self.counts['done'] += 1
+                self.counts['bytes_in'] += size_in
+                self.counts['bytes_out'] += size_out
+        except Exception as e:
+            stderr = getattr(e, 'stderr', None) or b''
+            logger.warning('Transcoding %s to %s failed: %s %s', name, encoding, e,
+                           stderr.decode('utf-8', 'replace').strip())
+            with self._lock:
+                self.counts['failed'] += 1
+        finally:
+            with self._lock:
+                self._pending.discard((name, encoding))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counts, pending=len(self._pending))
+        stats['ratio'] = (round(stats['bytes_out'] / stats['bytes_in'], 3)
+                          if stats['bytes_in'] else 0.0)
+        return stats
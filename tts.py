@@ -0,0 +1,251 @@
+"""Concurrent text-to-speech synthesis for podcast scripts."""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import re
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from aio import core
+from cache import DiskCache, make_key
+from metrics import bytes_total, tts_call_seconds, tts_errors
+from mp3 import strip_headers
+from tts_backends import make_router
+
+# Tuning knobs, overridable from the environment
+MAX_WORKERS = int(os.environ.get('TTS_MAX_WORKERS', '8'))
+MAX_RETRIES = int(os.environ.get('TTS_MAX_RETRIES', '3'))
+BACKOFF_BASE = float(os.environ.get('TTS_BACKOFF_BASE', '0.5'))  # seconds
+CACHE_DIR = os.environ.get('TTS_CACHE_DIR', os.path.join('.cache', 'tts'))
+CACHE_MAX_BYTES = int(os.environ.get('TTS_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+
+SENTENCE_END_RE = re.compile(r'(?<=[.!?…])\s+')
+# A full stop after these doesn't end a sentence
+ABBREVIATIONS = {'mr', 'mrs', 'ms', 'dr', 'prof', 'st', 'jr', 'sr', 'vs', 'etc',
+                 'inc', 'ltd', 'co', 'corp', 'no', 'fig', 'approx', 'dept', 'est'}
+INITIALS_RE = re.compile(r'(?:\b[A-Za-z]\.)+$')  # "J.", "U.S.", "e.g."
+
+
+# Default backend: the router over the engines in TTS_BACKENDS. Resolved
+# at call time, so tests and benchmarks can swap in a stub.
+default_backend = make_router()
+
+# Synthesized segments, keyed by line text and voice
+segment_cache = DiskCache(CACHE_DIR, CACHE_MAX_BYTES, suffix='.mp3')
+
+
+def segment_key(text, lang, voice, tag=''):
+    """Cache key for a line: whitespace-normalized text plus voice settings.
+
+    `tag` names the engine that speaks it, if the backend has several.
+    """
+    return make_key(' '.join(text.split()), lang, voice, tag)
+
+
+def synthesize_with_retry(backend, text, lang, voice,
+                          retries=MAX_RETRIES, backoff=BACKOFF_BASE):
+    """Call the backend, retrying failures with jittered exponential backoff."""
+    for attempt in range(retries + 1):
+        start = time.perf_counter()
+        try:
+            data = backend(text, lang, voice)
+        except Exception:
+            tts_errors.inc(voice)
+            if attempt == retries:
+                raise
+            time.sleep(backoff * (2 ** attempt) * (0.5 + random.random()))
+        else:
+            tts_call_seconds.observe(time.perf_counter() - start, voice)
+            bytes_total.inc('tts', amount=len(data))
+            return data
+
+
+def engines(backend, voice):
+    """(cache tag, callable) pairs to try in turn for `voice`."""
+    if hasattr(backend, 'engines'):
+        return backend.engines(voice)
+    return [(getattr(backend, 'cache_tag', ''), backend)]
+
+
+def synthesize_cached(backend, text, lang, voice, cache=None):
+    """Serve a line from the segment cache, synthesizing it on a miss.
+
+    Each engine the backend offers gets all its retries before the next one
+    is tried, and the audio is cached under the engine that made it.
+    """
+    last_error = None
+    for tag, engine in engines(backend, voice):
+        key = segment_key(text, lang, voice, tag)
+        data = cache.get(key) if cache is not None else None
+        if data is not None:
+            return data
+        try:
+            data = synthesize_with_retry(engine, text, lang, voice)
+        except Exception as e:
+            last_error = e
+            continue
+        if cache is not None:
+            cache.put(key, data)
+        return data
+    raise last_error or LookupError(f'No TTS backend has a voice for {voice!r}')
+
+
+def session(backend):
+    """The backend to use for one podcast; a router keeps each host's engine."""
+    return backend.session() if hasattr(backend, 'session') else backend
+
+
+def split_sentences(text):
+    """Split a dialogue turn into sentence-sized synthesis units.
+
+    Breaks after abbreviations and initials ("Dr. Smith", "the U.S. team")
+    are undone, so no unit ends mid-sentence with a falling intonation.
+    """
+    sentences = []
+    for part in SENTENCE_END_RE.split(text.strip()):
+        if not part:
+            continue
+        if sentences and ends_with_abbreviation(sentences[-1]):
+            sentences[-1] += ' ' + part
+        else:
+            sentences.append(part)
+    return sentences
+
+
+def ends_with_abbreviation(text):
+    if not text.endswith('.'):
+        return False
+    last = text.rsplit(None, 1)[-1]
+    return (last[:-1].lower() in ABBREVIATIONS
+            or INITIALS_RE.search(last.lstrip('("\'')) is not None)
+
+
+class Scheduler:
+    """Runs sentences from any number of scripts under one limit, longest first.
+
+    Lives on the async core's loop and is only touched from it. Give several
+    synthesize_lines calls the same scheduler (a batch does) to share
+    `max_workers` between them.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.max_workers = max(1, max_workers)
+        self.running = 0
+        self._waiting = []  # heap of (-length, seq, future)
+        self._seq = itertools.count()
+
+    @asynccontextmanager
+    async def slot(self, length):
+        if self.running < self.max_workers and not self._waiting:
+            self.running += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiting, (-length, next(self._seq), future))
+            try:
+                await future
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    # Handed the slot in the same moment the caller went away
+                    self._release()
+                raise
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _release(self):
+        self.running -= 1
+        while self._waiting and self.running < self.max_workers:
+            _, _, future = heapq.heappop(self._waiting)
+            if not future.done():  # cancelled waiters are skipped here
+                self.running += 1
+                future.set_result(None)
+
+
+async def synthesize_lines(segments, backend=None, lang='en',
+                           max_workers=MAX_WORKERS, cache=segment_cache,
+                           on_progress=None, scheduler=None):
+    """Synthesize (text, voice) segments concurrently on the async core.
+
+    Each segment is split into sentences, the sentences are scheduled
+    longest first (so the slowest requests don't end up at the tail), and
+    the audio is stitched back together per segment. Sentences are also
+    the unit of caching, so short stock phrases get reused across scripts.
+
+    Returns the MP3 bytes in the same order as `segments`. If any sentence
+    fails after all retries, the exception is raised and the caller gets
+    nothing. Pass cache=None to bypass the segment cache. `backend` defaults
+    to default_backend, looked up at call time so it can be swapped out.
+    At most `max_workers` sentences of this script are in flight at once,
+    or pass a shared Scheduler to limit and order several scripts together;
+    all scripts share the core's I/O executor. `on_progress(done, total)`
+    is called on the loop as segments finish.
+    """
+    if not segments:
+        return []
+    backend = session(backend or default_backend)
+
+    units = []  # (segment index, sentence, voice)
+    for index, (text, voice) in enumerate(segments):
+        for sentence in split_sentences(text):
+            units.append((index, sentence, voice))
+    remaining = [0] * len(segments)
+    for index, _, _ in units:
+        remaining[index] += 1
+    finished = 0
+    scheduler = scheduler or Scheduler(max_workers)
+
+    async def run(index, sentence, voice):
+        nonlocal finished
+        async with scheduler.slot(len(sentence)):
+            data = await core.offload(synthesize_cached, backend, sentence, lang, voice, cache)
+        remaining[index] -= 1
+        if remaining[index] == 0 and on_progress:
+            finished += 1
+            on_progress(finished, len(segments))
+        return data
+
+    tasks = [asyncio.ensure_future(run(*unit)) for unit in units]
+    try:
+        results = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    audio = [[] for _ in segments]
+    for (index, _, _), data in zip(units, results):
+        audio[index].append(strip_headers(data))
+    return [b''.join(parts) for parts in audio]
+
+
+def synthesize_stream(turns, backend=None, lang='en',
+                      max_workers=MAX_WORKERS, cache=segment_cache):
+    """Yield MP3 audio for (text, voice) turns in script order.
+
+    Turns are split into sentences and submitted to the pool as soon as
+    `turns` produces them, so synthesis overlaps with whatever is still
+    generating the script. Each sentence is yielded with its tag and VBR
+    info frame already stripped.
+    """
+    backend = session(backend or default_backend)
+    pool = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    pending = deque()
+    try:
+        for text, voice in turns:
+            for sentence in split_sentences(text):
+                pending.append(pool.submit(contextvars.copy_context().run,
+                                           synthesize_cached, backend, sentence,
+                                           lang, voice, cache))
+            while pending and pending[0].done():
+                yield bytes(strip_headers(pending.popleft().result()))
+        while pending:
+            yield bytes(strip_headers(pending.popleft().result()))
+    finally:
+        # Client went away or a line failed: drop whatever is still queued
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,249 @@
+"""Text-to-speech backends and the router that picks between them.
+
+A backend turns (text, lang, voice) into MP3 bytes. Voices are configured
+per host and per backend (TTS_VOICES, JSON), so Alex and Sam keep distinct
+voices whichever engine speaks them. The router ranks backends in
+TTS_BACKENDS order, skipping ones that have recently been failing, or, with
+TTS_ROUTING=balance, spreads the choice over the healthy ones by observed
+latency. A podcast synthesizes through a RouterSession, which keeps each
+host on one engine unless that engine goes down.
+"""
+import io
+import json
+import logging
+import os
+import random
+import shutil
+import subprocess
+import threading
+import time
+from functools import partial
+
+logger = logging.getLogger('huxe')
+
+RATE_PER_HOST = float(os.environ.get('TTS_RATE_PER_HOST', '5'))  # gTTS requests/sec per tld
+BACKEND_NAMES = [name.strip() for name in
+                 os.environ.get('TTS_BACKENDS', 'gtts,espeak').split(',') if name.strip()]
+ROUTING = os.environ.get('TTS_ROUTING', 'failover')  # or 'balance'
+SUBPROCESS_TIMEOUT = 30  # seconds
+
+DEFAULT_VOICES = {
+    'Alex': {'gtts': 'us', 'espeak': 'en-us+m3'},  # American accent for Alex
+    'Sam': {'gtts': 'co.uk', 'espeak': 'en-gb+f3'},  # British accent for Sam
+}
+VOICES = json.loads(os.environ['TTS_VOICES']) if os.environ.get('TTS_VOICES') else DEFAULT_VOICES
+
+
+class RateLimiter:
+    """Token bucket per TTS host (gTTS talks to translate.google.<tld>)."""
+
+    def __init__(self, rate=RATE_PER_HOST, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, host):
+        """Block until a request to `host` is allowed."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                tokens, last = self._buckets.get(host, (self.burst, now))
+                tokens = min(self.burst, tokens + (now - last) * self.rate)
+                if tokens >= 1:
+                    self._buckets[host] = (tokens - 1, now)
+                    return
+                self._buckets[host] = (tokens, now)
+                wait = (1 - tokens) / self.rate
+            time.sleep(wait)
+
+
+# Shared across requests so the per-host limit holds for the whole process
+rate_limiter = RateLimiter()
+
+
+class GTTSBackend:
+    """Google Translate TTS; the voice is the tld that selects the accent."""
+
+    name = 'gtts'
+
+    def __init__(self, limiter=rate_limiter):
+        self.limiter = limiter
+
+    def available(self):
+        return True
+
+    def synthesize(self, text, lang, voice):
+        from gtts import gTTS  # deferred: pulls in requests, which startup doesn't need
+
+        if self.limiter:
+            self.limiter.acquire(voice)
+        buffer = io.BytesIO()
+        gTTS(text=text, lang=lang, tld=voice).write_to_fp(buffer)
+        return buffer.getvalue()
+
+
+class EspeakBackend:
+    """Local espeak-ng, encoded by ffmpeg to the same MP3 format gTTS returns.
+
+    The voice is an espeak voice name such as 'en-us+m3'; it already carries
+    the language, so `lang` is ignored.
+    """
+
+    name = 'espeak'
+
+    def __init__(self, binary='espeak-ng', ffmpeg='ffmpeg', speed=170):
+        self.binary = binary
+        self.ffmpeg = ffmpeg
+        self.speed = speed
+
+    def available(self):
+        return bool(shutil.which(self.binary) and shutil.which(self.ffmpeg))
+
+    def synthesize(self, text, lang, voice):
+        wav = subprocess.run(
+            [self.binary, '-v', voice, '-s', str(self.speed), '--stdout', '--stdin'],
+            input=text.encode('utf-8'), capture_output=True, check=True,
+            timeout=SUBPROCESS_TIMEOUT).stdout
+        # 24 kHz mono like gTTS, without ID3/Xing so segments join cleanly
+        return subprocess.run(
+            [self.ffmpeg, '-hide_banner', '-loglevel', 'error', '-f', 'wav', '-i', 'pipe:0',
+             '-ac', '1', '-ar', '24000', '-b:a', '32k', '-write_xing', '0',
+             '-id3v2_version', '0', '-f', 'mp3', 'pipe:1'],
+            input=wav, capture_output=True, check=True, timeout=SUBPROCESS_TIMEOUT).stdout
+
+
+BACKENDS = {backend.name: backend for backend in (GTTSBackend, EspeakBackend)}
+
+
+class BackendRouter:
+    """TTS backend that ranks several engines by health and speed.
+
+    Latency and error rate are tracked per engine as moving averages. An
+    engine whose error rate is above `max_error_rate` is ranked last, except
+    for an occasional probe every `probe_interval` seconds to see if it is
+    back. Callers try engines() in turn, retrying each before moving on.
+    """
+
+    def __init__(self, backends, voices, mode=ROUTING, alpha=0.2,
+                 max_error_rate=0.5, probe_interval=30):
+        self.backends = list(backends)
+        self.voices = voices
+        self.mode = mode
+        self.alpha = alpha
+        self.max_error_rate = max_error_rate
+        self.probe_interval = probe_interval
+        self._stats = {b.name: {'latency': None, 'error_rate': 0.0, 'last_failure': 0.0}
+                       for b in self.backends}
+        self._lock = threading.Lock()
+
+    def _healthy(self, backend, now):
+        stats = self._stats[backend.name]
+        return (stats['error_rate'] < self.max_error_rate
+                or now - stats['last_failure'] > self.probe_interval)
+
+    def healthy(self, backend):
+        with self._lock:
+            return self._healthy(backend, time.monotonic())
+
+    def _order(self):
+        now = time.monotonic()
+        with self._lock:
+            healthy = [b for b in self.backends if self._healthy(b, now)]
+            latency = {b.name: self._stats[b.name]['latency'] for b in healthy}
+        unhealthy = [b for b in self.backends if b not in healthy]
+        if self.mode == 'balance' and len(healthy) > 1:
+            # Weighted shuffle: faster engines are more likely to go first
+            known = [v for v in latency.values() if v]
+            default = sum(known) / len(known) if known else 1.0
+            weighted = [(random.random() ** (latency[b.name] or default), b) for b in healthy]
+            healthy = [b for _, b in sorted(weighted, key=lambda pair: pair[0], reverse=True)]
+        return healthy + unhealthy
+
+    def _record(self, backend, elapsed):
+        with self._lock:
+            stats = self._stats[backend.name]
+            failed = elapsed is None
+            stats['error_rate'] += self.alpha * (float(failed) - stats['error_rate'])
+            if failed:
+                stats['last_failure'] = time.monotonic()
+            elif stats['latency'] is None:
+                stats['latency'] = elapsed
+            else:
+                stats['latency'] += self.alpha * (elapsed - stats['latency'])
+
+    def synthesize(self, backend, text, lang, host):
+        """One call to `backend` in `host`'s voice, with the outcome recorded."""
+        start = time.perf_counter()
+        try:
+            data = backend.synthesize(text, lang, self.voices[host][backend.name])
+        except Exception as e:
+            self._record(backend, None)
+            logger.warning('TTS backend %s failed: %s', backend.name, e)
+            raise
+        self._record(backend, time.perf_counter() - start)
+        return data
+
+    def candidates(self, host):
+        """Engines with a voice for `host`, best first."""
+        return [b for b in self._order() if b.name in self.voices.get(host, {})]
+
+    def engines(self, host, candidates=None):
+        """(cache tag, callable) pairs to try in turn for `host`.
+
+        The tag names the engine and its voice, so cached audio is only
+        reused for the engine that made it.
+        """
+        return [(f'{b.name}:{self.voices[host][b.name]}', partial(self.synthesize, b))
+                for b in (self.candidates(host) if candidates is None else candidates)]
+
+    def session(self):
+        return RouterSession(self)
+
+    def stats(self):
+        """Flat latency/error-rate numbers per engine, for /metrics."""
+        with self._lock:
+            flat = {}
+            for name, stats in self._stats.items():
+                flat[f'{name}_latency_seconds'] = stats['latency'] or 0.0
+                flat[f'{name}_error_rate'] = stats['error_rate']
+            return flat
+
+
+class RouterSession:
+    """Engine choice for one podcast: each host sticks to one engine.
+
+    Routing per sentence could switch a host's voice mid-turn. A host is
+    pinned to the best engine on its first sentence and only moves when
+    that engine turns unhealthy, i.e. fails even after retries.
+    """
+
+    def __init__(self, router):
+        self.router = router
+        self._pinned = {}
+        self._lock = threading.Lock()
+
+    def engines(self, host):
+        with self._lock:
+            pinned = self._pinned.get(host)
+            candidates = self.router.candidates(host)
+            if pinned is None or not self.router.healthy(pinned):
+                pinned = self._pinned[host] = candidates[0] if candidates else None
+        rest = [b for b in candidates if b is not pinned]
+        return self.router.engines(host, ([pinned] if pinned else []) + rest)
+
+
+def make_router(names=BACKEND_NAMES, voices=VOICES):
+    """Build the router from TTS_BACKENDS, dropping engines that aren't installed."""
+    backends = []
+    for name in names:
+        if name not in BACKENDS:
+            raise ValueError(f'Unknown TTS backend {name!r}')
+        backend = BACKENDS[name]()
+        if backend.available():
+            backends.append(backend)
+        else:
+            logger.info('TTS backend %s is not installed; skipping it', name)
+    return BackendRouter(backends, voices)